@@ -0,0 +1,68 @@
+"""
+Headless batch run: extract and match many PDFs against one registry.
+
+    python batch.py magazines/ extra/*.pdf --registry registry.xlsx --output results
+
+Directories are expanded to the PDFs they contain; glob patterns are
+expanded here so they also work from shells that do not expand them.
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+
+
+def collect_pdfs(inputs):
+    """Expand directories and glob patterns into a sorted list of PDF paths, without duplicates."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(os.path.join(item, name) for name in sorted(os.listdir(item))
+                         if name.lower().endswith('.pdf'))
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item)))
+        else:
+            paths.append(item)
+    seen = set()
+    return [path for path in paths
+            if not (os.path.abspath(path) in seen or seen.add(os.path.abspath(path)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help="PDF files, directories or glob patterns")
+    parser.add_argument('--registry', required=True, help="Registry Excel file")
+    parser.add_argument('--output', required=True, help="Output folder")
+    parser.add_argument('--sim-cat', action='store_true', help="Only match names within the same category")
+    parser.add_argument('--threshold', type=int, default=100, help="Similarity threshold (default 100)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Send OCR requests from one event loop (see src.async_ocr)")
+    parser.add_argument('--resume', action='store_true', help="Continue interrupted runs from their journals")
+    parser.add_argument('--format', dest='output_format', choices=['xlsx', 'csv', 'parquet'],
+                        help="Output format (default OUTPUT_FORMAT)")
+    args = parser.parse_args(argv)
+
+    pdf_paths = collect_pdfs(args.inputs)
+    missing = [path for path in pdf_paths if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"not found: {', '.join(missing)}")
+    if not pdf_paths:
+        parser.error("no PDF files found")
+    os.makedirs(args.output, exist_ok=True)
+
+    # Imported here, not at the top: worker processes started with spawn
+    # re-import this script and only need what their tasks use
+    from src.main import batch_flow
+    summary = batch_flow(pdf_paths, args.registry, args.output, sim_cat=args.sim_cat, threshold=args.threshold,
+                         use_async=args.use_async, resume=args.resume, output_format=args.output_format)
+    failed = [path for path, rows, _, _ in summary if rows is None]
+    for path, rows, matches, seconds in summary:
+        status = "FAILED" if rows is None else f"{rows} names, {matches} matches"
+        print(f"{path}: {status} ({seconds:.1f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
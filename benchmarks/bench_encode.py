@@ -0,0 +1,73 @@
+"""
+Benchmark: `encode_image` under each encoding policy.
+
+Encodes a mix of the images magazines carry: synthetic logos (flat), the
+same logos padded with wide white margins, tiny and banner-shaped logos, and
+photo-like scans. For each policy it reports the payload size, the vision
+tokens the API would bill, the encode time, and how many logos the mock OCR
+endpoint still reads right from the payload.
+
+Run from the repository root:
+    python -m benchmarks.bench_encode [logos]
+"""
+import base64
+import os
+import sys
+from time import perf_counter as counter
+
+import cv2
+import numpy as np
+
+from benchmarks.mock_openai import _vision_tokens
+from benchmarks.synthetic import make_logo, read_logo_id
+
+POLICIES = ("half", "adaptive")
+
+
+def make_images(logos: int, seed: int = 0) -> list:
+    """(kind, brand or None, PNG/JPEG bytes) for the mix of images."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for brand in range(1, logos + 1):
+        logo = make_logo(brand)
+        gray = cv2.imdecode(np.frombuffer(logo, np.uint8), cv2.IMREAD_GRAYSCALE)
+        images.append(("logo", brand, logo))
+        padded = cv2.copyMakeBorder(gray, 200, 200, 300, 300, cv2.BORDER_CONSTANT, value=255)
+        images.append(("padded logo", brand, cv2.imencode('.png', padded)[1].tobytes()))
+        images.append(("large logo", brand, cv2.imencode('.png', cv2.resize(gray, None, fx=5, fy=5))[1].tobytes()))
+        tiny = cv2.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        images.append(("tiny logo", brand, cv2.imencode('.png', tiny)[1].tobytes()))
+    for _ in range(max(1, logos // 4)):
+        y, x = np.mgrid[0:1600, 0:2400]
+        photo = (127 + 60 * np.sin(x / rng.uniform(40, 200)) * np.cos(y / rng.uniform(40, 200))
+                 + rng.normal(0, 20, x.shape)).clip(0, 255).astype(np.uint8)
+        images.append(("photo scan", None, cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()))
+    return images
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    from src.open_ocr import encode_image, image_detail
+
+    images = make_images(int(argv[0]) if argv else 24)
+    kinds = list(dict.fromkeys(kind for kind, _, _ in images))
+    print(f"{len(images)} images")
+    print(f"{'policy':<10}{'kind':<14}{'bytes/image':>12}{'tokens/image':>14}{'ms/image':>10}{'logos read':>12}")
+    for policy in POLICIES:
+        os.environ["ENCODE_POLICY"] = policy
+        for kind in kinds:
+            subset = [(brand, image) for k, brand, image in images if k == kind]
+            start = counter()
+            payloads = [encode_image(image) for _, image in subset]
+            seconds = counter() - start
+            decoded = [cv2.imdecode(np.frombuffer(base64.b64decode(payload), np.uint8), cv2.IMREAD_GRAYSCALE)
+                       for payload in payloads]
+            read = sum(read_logo_id(gray) == brand for (brand, _), gray in zip(subset, decoded) if brand)
+            logos = sum(1 for brand, _ in subset if brand)
+            print(f"{policy:<10}{kind:<14}{sum(map(len, payloads)) / len(subset):12.0f}"
+                  f"{sum(map(_vision_tokens, decoded, map(image_detail, payloads))) / len(subset):14.0f}"
+                  f"{seconds * 1000 / len(subset):10.2f}{f'{read}/{logos}' if logos else '-':>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: import time of the entry points, each in a fresh interpreter.
+
+Imports what the GUI needs to draw its window, what a pool worker imports
+(src.pdf_worker, src.extracting_images), what it adds once it sends OCR
+requests (`ocr_payloads` imports openai through `call_with_limits`) and the
+whole pipeline (src.main), under `python -X importtime`. For each one it
+reports the total time (ms), the heaviest packages, and whether openai or
+pandas got loaded where they are not needed: a worker that only reads pages
+sends no request, and no worker builds a DataFrame.
+
+Run from the repository root:
+    python -m benchmarks.bench_import [--repeat 3] [--max-ms 0]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+TARGETS = [
+    ("gui window", "import tkinter, tkinter.ttk, tkinter.filedialog, tkinter.messagebox, multiprocessing, queue, threading"),
+    ("pdf worker", "import src.pdf_worker"),
+    ("worker tasks", "import src.extracting_images"),
+    ("ocr worker", "import src.extracting_images, openai"),
+    ("pipeline", "import src.main"),
+]
+# Worker targets, with the packages each one never needs
+WORKER_TARGETS = {
+    "pdf worker": ("openai", "pandas"),
+    "worker tasks": ("openai", "pandas"),
+    "ocr worker": ("pandas",),
+}
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(code: str) -> list:
+    """(cumulative µs, nesting depth, module) of every module `code` imports, in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append((int(match[2]), len(match[3]), match[4]))
+    return modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time of the entry points")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the fastest is kept")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest packages listed per target")
+    parser.add_argument("--max-ms", type=float, default=0,
+                        help="Fail when a worker import takes longer (0: no limit)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for label, code in TARGETS:
+        runs = [import_times(code) for _ in range(args.repeat)]
+        modules = min(runs, key=lambda run: sum(us for us, depth, _ in run if depth == 1))
+        total = sum(us for us, depth, _ in modules if depth == 1) / 1000
+        # Cumulative, so a package imported by another one counts in both
+        packages = sorted(((us, name) for us, _, name in modules if '.' not in name and name != "src"),
+                          reverse=True)
+        heaviest = ", ".join(f"{name} {us / 1000:.0f}" for us, name in packages[:args.top])
+        loaded = {name.split('.')[0] for _, _, name in modules}
+        print(f"{label:<14}{total:8.0f} ms  ({heaviest})")
+        if label in WORKER_TARGETS:
+            unwanted = [name for name in WORKER_TARGETS[label] if name in loaded]
+            if unwanted:
+                print(f"{'':<14}loads {', '.join(unwanted)}, which a worker never uses")
+                failed = True
+            if args.max_ms and total > args.max_ms:
+                print(f"{'':<14}over the {args.max_ms:.0f} ms budget")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Recall check and benchmark: n-gram candidate index against exhaustive matching.
+
+For each threshold, every query is matched with `match_names` (all pairs)
+and with `match_names_indexed`; the index must find every exhaustive match
+(recall 1.0) and nothing else.
+
+Run from the repository root:
+    python -m benchmarks.bench_name_index [registry_rows] [queries]
+"""
+import random
+import sys
+from time import perf_counter as counter
+
+import numpy as np
+
+from benchmarks.bench_similar_names import make_name, perturb
+from src.similar_names import build_index, match_names, match_names_indexed, sort_tokens
+
+
+def main(registry_rows: int = 50000, n_queries: int = 300):
+    rng = random.Random(1)
+    names = [make_name(rng) for _ in range(registry_rows)]
+    queries = [perturb(rng.choice(names), rng) for _ in range(n_queries)]
+
+    start = counter()
+    index = build_index(names)
+    print(f"{registry_rows} registry names, {n_queries} queries, index built in {counter() - start:.2f}s")
+
+    ok = True
+    for threshold in (100, 90, 85, 80, 70):
+        start = counter()
+        exhaustive = [set(hits.tolist()) for _, hits in match_names(queries, names, threshold)]
+        exhaustive_time = counter() - start
+        start = counter()
+        indexed = [set(hits.tolist()) for _, hits in match_names_indexed(queries, index, threshold)]
+        indexed_time = counter() - start
+        candidates = np.mean([len(index.candidates(sort_tokens(q), threshold)) for q in queries]) / registry_rows
+
+        expected = sum(map(len, exhaustive))
+        found = sum(len(a & b) for a, b in zip(exhaustive, indexed))
+        extra = sum(len(b - a) for a, b in zip(exhaustive, indexed))
+        recall = found / expected if expected else 1.0
+        ok = ok and found == expected and not extra
+        print(f"threshold {threshold:3d}: recall {recall:.4f} ({found}/{expected}), {extra} extra, "
+              f"{candidates:6.2%} of names scored, exhaustive {exhaustive_time:6.2f}s, "
+              f"indexed {indexed_time:6.2f}s ({exhaustive_time / indexed_time:.1f}x)")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*map(int, sys.argv[1:])) else 1)
@@ -0,0 +1,117 @@
+"""
+Benchmark: the whole pipeline offline, against a mock OCR endpoint.
+
+Generates a synthetic magazine and registry (benchmarks/synthetic.py),
+starts the stand-in chat-completions server (benchmarks/mock_openai.py) and
+points the OpenAI client at it, then times, each from a cold OCR cache:
+
+- `extract` and `extract_async`: pages/s, OCR calls/s, and whether every
+  logo and page field was read right;
+- `find_similar_names` on the extracted rows: matches/s;
+- the full `flow` (registry load, extraction, matching, output files).
+
+No API quota is used. Run from the repository root:
+    python -m benchmarks.bench_pipeline [--pages 40] [--latency 0.2] [--rate-limit 0.05] ...
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from time import perf_counter as counter
+
+from benchmarks.mock_openai import MockOpenAI
+from benchmarks.synthetic import make_magazine, make_registry, check_extraction
+
+
+def report(label: str, seconds: float, pages: int, server: MockOpenAI, extra: str = ""):
+    print(f"{label:<20}{seconds:7.2f}s  {pages / seconds:7.1f} pages/s  "
+          f"{server.requests / seconds:7.1f} OCR calls/s  ({server.requests} calls, "
+          f"{server.images} images, {server.refused} refused){extra}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark against a mock OCR endpoint")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--logos-per-page", type=int, default=6)
+    parser.add_argument("--brands", type=int, default=150, help="Distinct logos the pages draw from")
+    parser.add_argument("--captions", type=float, default=0.0,
+                        help="Share of logos with their name printed under them (text-layer shortcut)")
+    parser.add_argument("--registry-rows", type=int, default=20000)
+    parser.add_argument("--threshold", type=int, default=90)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per OCR request")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random seconds per request")
+    parser.add_argument("--rate-limit", type=float, default=0.05, help="Share of requests refused with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of a 429, seconds")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Share of replies cut short")
+    parser.add_argument("--rpm", type=int, default=600, help="REQUESTS_PER_MINUTE budget")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder, \
+            MockOpenAI(args.latency, args.jitter, args.rate_limit, args.retry_after,
+                       malformed=args.malformed) as server:
+        # Read when src.open_ocr is imported and the OCR clients are built
+        os.environ.update(OPENAI_BASE_URL=server.url, OPENAI_API_KEY="mock", MODEL_NAME="mock-ocr",
+                          OCR_CACHE_PATH=os.path.join(folder, "ocr_cache.db"),
+                          REQUESTS_PER_MINUTE=str(args.rpm))
+        if args.captions:
+            # The synthetic captions are English only (see benchmarks/synthetic.py)
+            os.environ.update(TEXT_LAYER_MAX_GAP="6", TEXT_LAYER_MIN_NAMES="1")
+        from src.async_ocr import extract_async
+        from src.extracting_images import extract
+        from src.main import flow
+        from src.ocr_cache import get_cache
+        from src.similar_names import find_similar_names
+
+        pdf_path = os.path.join(folder, "magazine.pdf")
+        excel_path = os.path.join(folder, "registry.xlsx")
+        expected = make_magazine(pdf_path, args.pages, args.logos_per_page, args.brands, captions=args.captions)
+        registry = make_registry(excel_path, args.registry_rows, args.brands)
+        print(f"{args.pages} pages x {args.logos_per_page} logos from {args.brands} brands "
+              f"({args.captions:.0%} captioned), "
+              f"{args.registry_rows} registry rows; mock latency {args.latency}s"
+              f" (+{args.jitter}s), {args.rate_limit:.0%} refused, {args.malformed:.0%} malformed, "
+              f"{args.rpm} requests/min")
+
+        correct = True
+        for label, run in (("extract", extract), ("extract_async", extract_async)):
+            get_cache().clear()
+            server.reset_stats()
+            output = os.path.join(folder, label)
+            os.makedirs(output)
+            start = counter()
+            df = run(pdf_path, output)
+            seconds = counter() - start
+            accuracy = check_extraction(expected, df)
+            correct &= accuracy == {"logos": 1.0, "fields": 1.0, "extra_rows": 0}
+            report(label, seconds, args.pages, server,
+                   f"; logos {accuracy['logos']:.1%} right, fields {accuracy['fields']:.1%} right, "
+                   f"{accuracy['extra_rows']} extra rows")
+
+        start = counter()
+        matches = find_similar_names(registry, df, threshold=args.threshold)
+        seconds = counter() - start
+        print(f"{'find_similar_names':<20}{seconds:7.2f}s  {len(matches) / seconds:7.0f} matches/s  "
+              f"({len(df)} names, {len(matches)} matches)")
+
+        get_cache().clear()
+        server.reset_stats()
+        output = os.path.join(folder, "flow")
+        os.makedirs(output)
+        start = counter()
+        flow(pdf_path, excel_path, output, threshold=args.threshold, output_format="csv")
+        seconds = counter() - start
+        with open(os.path.join(output, "run_report.json"), encoding="utf-8") as f:
+            run_report = json.load(f)
+        latency = run_report["ocr_latency"]["percentiles"]
+        per_image = run_report["per_image"]
+        report("flow", seconds, args.pages, server,
+               f"; {run_report['match_rows'] / seconds:.0f} matches/s, "
+               f"OCR p50 {latency['p50']}s p95 {latency['p95']}s, "
+               f"{per_image['payload_bytes']} payload bytes and {per_image['tokens']} tokens per image, "
+               f"{run_report['counters']['ocr_parse_failures']} parse failures")
+    return correct
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
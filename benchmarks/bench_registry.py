@@ -0,0 +1,73 @@
+"""
+Benchmark: `pd.read_excel` against the cached registry snapshot.
+
+Writes a synthetic registry workbook, then times a plain read_excel, the
+first `load_registry` (reads the workbook, stores the snapshot, builds the
+index) and a second one (reads the snapshot, rebuilds the index), and checks
+both loads return the same data.
+
+Run from the repository root:
+    python -m benchmarks.bench_registry [rows]
+"""
+import itertools
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter as counter
+
+import pandas as pd
+
+from benchmarks.bench_similar_names import make_name
+from src.registry import load_registry
+
+
+def make_workbook(path: str, rows: int):
+    rng = random.Random(2)
+    names = [make_name(rng) for _ in range(rows)]
+    for i, odd in zip(range(0, rows, 50), itertools.cycle([7, "Line\nbreak", None, ""])):
+        names[i] = odd  # Excel mixes types and empty cells into the column
+    pd.DataFrame({
+        "serial": range(rows),
+        "name": names,
+        "owner": [make_name(rng) for _ in range(rows)],  # not loaded
+        "grp_code": [rng.randint(1, 45) if rng.random() < 0.98 else None for _ in range(rows)],
+        "file_no": [f"F{i:06d}" if i % 3 else i for i in range(rows)],
+    }).to_excel(path, index=False)
+
+
+def main(rows: int = 50000):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "registry.xlsx")
+        make_workbook(path, rows)
+        print(f"{rows} rows, {os.path.getsize(path) / 1e6:.1f} MB workbook")
+
+        start = counter()
+        pd.read_excel(path)
+        print(f"read_excel:                   {counter() - start:7.3f}s")
+
+        timings = []
+        results = []
+        for _ in range(2):
+            start = counter()
+            registry, index = load_registry(path, with_index=True)
+            timings.append(counter() - start)
+            results.append((registry, index))
+        print(f"load_registry, no snapshot:   {timings[0]:7.3f}s (reads, stores snapshot, builds index)")
+        print(f"load_registry, snapshot:      {timings[1]:7.3f}s ({timings[0] / timings[1]:.0f}x)")
+
+        (cold, cold_index), (warm, warm_index) = results
+        same = cold.equals(warm) and all(
+            (cold_index.match(query, 90) == warm_index.match(query, 90)).all()
+            for query in cold_index.choices[:200])
+        print(f"snapshot {'matches' if same else 'DIFFERS FROM'} the workbook")
+
+        os.utime(path)  # Touched but unchanged: verified by content hash
+        start = counter()
+        load_registry(path, with_index=True)
+        print(f"load_registry, touched file:  {counter() - start:7.3f}s")
+    return same
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*map(int, sys.argv[1:])) else 1)
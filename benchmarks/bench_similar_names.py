@@ -0,0 +1,85 @@
+"""
+Benchmark: `find_similar_names` with each matching engine.
+
+Builds a synthetic registry and OCR table, runs every engine for a few
+thresholds and checks that they return the same rows. The fuzzywuzzy engine
+matches the shipped build only when python-Levenshtein is installed.
+
+Run from the repository root:
+    python -m benchmarks.bench_similar_names [registry_rows] [ocr_rows]
+"""
+import random
+import sys
+from time import perf_counter as counter
+
+import pandas as pd
+
+from src.similar_names import find_similar_names
+
+SYLLABLES = ["ra", "mo", "ta", "ki", "lu", "sa", "ne", "do", "fa", "zi", "co", "ba"]
+ENGINES = ("fuzzywuzzy", "rapidfuzz", "index")
+ARABIC_WORDS = ["الأمل", "النور", "مصر", "الذهبي", "السلام", "الشرق", "النجمة", "الملكة", "الصقر", "الوادي"]
+
+
+def make_name(rng: random.Random) -> str:
+    if rng.random() < 0.4:
+        return " ".join(rng.choices(ARABIC_WORDS, k=rng.randint(1, 3)))
+    words = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+    return " ".join(word.capitalize() if rng.random() < 0.5 else word.upper() for word in words)
+
+
+def perturb(name: str, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.3:
+        return name
+    if roll < 0.5:
+        return " ".join(reversed(name.split()))  # token order does not matter to token_sort_ratio
+    if roll < 0.8 and len(name) > 3:
+        i = rng.randrange(len(name))
+        return name[:i] + rng.choice("aeiouxy") + name[i + 1:]
+    return make_name(rng)
+
+
+def make_tables(registry_rows: int, ocr_rows: int):
+    rng = random.Random(0)
+    names = [make_name(rng) for _ in range(registry_rows)]
+    names[::97] = ["."] * len(names[::97])
+    # read_excel gives float codes when some cells are empty; pages give strings
+    codes = [float(rng.randint(1, 45)) if rng.random() < 0.98 else float("nan") for _ in names]
+    excel = pd.DataFrame({
+        "name": names,
+        "grp_code": codes,
+        "serial": range(registry_rows),
+        "file_no": [f"F{i:06d}" for i in range(registry_rows)],
+    })
+    rows = []
+    for page in range(ocr_rows):
+        source = rng.randrange(registry_rows)
+        category = codes[source] if rng.random() < 0.7 and codes[source] == codes[source] else rng.randint(1, 45)
+        rows.append((perturb(names[source], rng), perturb(make_name(rng), rng), page + 1, str(int(category)), "1000"))
+    ocr_df = pd.DataFrame(rows, columns=["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page",
+                                         "Magazine_Category_id", "Magazine_Request_Number"])
+    return excel, ocr_df
+
+
+def main(registry_rows: int = 2000, ocr_rows: int = 40):
+    excel, ocr_df = make_tables(registry_rows, ocr_rows)
+    print(f"{registry_rows} registry names x {ocr_rows} OCR rows")
+    same = True
+    for threshold, sim_cat in ((100, False), (90, False), (75, False), (100, True), (90, True)):
+        timings = {}
+        results = {}
+        for engine in ENGINES:
+            start = counter()
+            results[engine] = find_similar_names(excel, ocr_df, threshold=threshold, sim_cat=sim_cat,
+                                                 engine=engine).reset_index(drop=True)
+            timings[engine] = counter() - start
+        equal = all(results[engine].equals(results[ENGINES[0]]) for engine in ENGINES)
+        same = same and equal
+        print(f"threshold {threshold:3d}{', sim_cat' if sim_cat else '':9}: " + ", ".join(f"{engine} {timings[engine]:6.2f}s" for engine in ENGINES)
+              + f", {len(results[ENGINES[0]])} rows, {'same' if equal else 'DIFFERENT'} output")
+    return same
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*map(int, sys.argv[1:])) else 1)
@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: category / request-number extraction on synthetic page text.
+
+Compares `extract_cat` + `extract_request_number` (one `re.finditer` per raw
+pattern) with `extract_fields` (normalize once, one compiled scan), and checks
+that both agree wherever the old functions found a value.
+
+Run from the repository root:
+    python -m benchmarks.bench_text_fields [pages]
+"""
+import random
+import sys
+from time import perf_counter as counter
+
+from src.extracting_images import extract_cat, extract_request_number
+from src.text_fields import extract_fields, normalize_text
+
+WORDS = ["شركة", "للتجارة", "والصناعة", "منتجات", "غذائية", "مصر", "القاهرة", "ﺍﻟﺘﺠﺎﺭﺓ", "ﻣﻨﺘﺠﺎﺕ",
+         "Trade", "Mark", "Co.", "تاريخ", "الإيداع", "2024/01/15", "ﺍﻟﻌﻨﻮﺍﻥ", "شارع", "رقم", "١٥"]
+
+CATEGORY_PHRASES = [
+    "فئات العلامة : {n}",
+    "فئات الع ـ المة: {n}",
+    "ﻓﺌﺎﺕ ﺍﻟﻌـﻼﻣﺔ : {n}",
+    "ﺍﻟﻔﺌﺔ {n}",
+    "بالفئة {n}",
+    "فئة {n}",
+    "ة الم : {n}",
+]
+
+REQUEST_PHRASES = [
+    "قدم عنها طلب رقم : {n}",
+    "ﻗﺪﻡ ﻋﻨﻬﺎ ﻁﻠﺐ ﺭﻗﻢ : {n}",
+    "ﻗﺪﻡ ﻋﻨﻬﺎ ﻁﻠﺐ ﺭﻗﻢ :{n}",
+    "قد م عنه اطلب رقم: {n}",
+]
+
+ARABIC_DIGITS = str.maketrans("0123456789", "٠١٢٣٤٥٦٧٨٩")
+
+
+def make_page(rng: random.Random) -> str:
+    lines = [" ".join(rng.choices(WORDS, k=rng.randint(4, 12))) for _ in range(rng.randint(20, 60))]
+    for phrases, digits in ((CATEGORY_PHRASES, 2), (REQUEST_PHRASES, 6)):
+        if rng.random() < 0.9:
+            n = str(rng.randint(10 ** (digits - 1), 10 ** digits - 1))
+            if rng.random() < 0.3:
+                n = n.translate(ARABIC_DIGITS)
+            lines.insert(rng.randrange(len(lines) + 1), rng.choice(phrases).format(n=n))
+    return "\n".join(lines)
+
+
+def old_fields(text: str):
+    return extract_cat(text), extract_request_number(text)
+
+
+def timed(function, pages, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = counter()
+        results = [function(page) for page in pages]
+        best = min(best, counter() - start)
+    return best, results
+
+
+def main(n_pages: int = 2000):
+    rng = random.Random(0)
+    pages = [make_page(rng) for _ in range(n_pages)]
+
+    old_time, old_results = timed(old_fields, pages)
+    new_time, new_results = timed(extract_fields, pages)
+
+    agree = differ = newly_found = 0
+    for old, new in zip(old_results, new_results):
+        for old_value, new_value in zip(old, new):
+            if old_value is None:
+                newly_found += new_value is not None
+            elif normalize_text(old_value) == new_value:
+                agree += 1
+            else:
+                differ += 1
+
+    print(f"{n_pages} pages, {sum(map(len, pages)) / n_pages:.0f} characters per page")
+    print(f"extract_cat + extract_request_number: {old_time * 1e6 / n_pages:8.1f} us/page")
+    print(f"extract_fields:                       {new_time * 1e6 / n_pages:8.1f} us/page "
+          f"({old_time / new_time:.1f}x)")
+    print(f"fields: {agree} agree, {differ} differ, {newly_found} found only after normalization")
+    return differ == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(*map(int, sys.argv[1:])) else 1)
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the chat-completions endpoint, for offline benchmarks.
+
+Answers the OCR prompts of src/open_ocr.py with the brand encoded in each
+logo (see benchmarks/synthetic.py): JSON following the requested
+response_format, or without one a python dict for one image and a list of
+dicts with IMAGE numbers for a batch. Every request waits `latency` seconds
+(plus up to `jitter`), and a `rate_limit` share of them is refused with a
+429 and a Retry-After, as the API does when the quota is spent. A
+`malformed` share of the replies is cut short, to exercise the parser.
+
+Point the client at it with OPENAI_BASE_URL=<server.url> before the first
+OCR request is sent.
+"""
+import base64
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import brand_name, read_logo_id
+
+
+def _vision_tokens(gray, detail: str = "auto") -> int:
+    """Image tokens as the API bills them: a flat 85 with detail "low", else 85 plus 170 per 512px tile."""
+    if detail == "low":
+        return 85
+    height, width = gray.shape
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+
+def _answer(image_url: dict):
+    """(answer dict, image tokens) for one image_url part."""
+    payload = base64.b64decode(image_url["url"].split(",", 1)[1])
+    gray = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_GRAYSCALE)
+    detail = image_url.get("detail", "auto")
+    if gray is None:
+        return {}, _vision_tokens(np.zeros((1, 1), np.uint8), detail)
+    if detail == "low" and max(gray.shape) > 512:
+        # The model only sees the image shrunk into the low-detail tile
+        scale = 512 / max(gray.shape)
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    name = brand_name(read_logo_id(gray))
+    return ({"EN": name} if name.isascii() else {"AR": name}), _vision_tokens(gray, detail)
+
+
+class MockOpenAI:
+    """Threaded HTTP server; use as a context manager, or call start/stop."""
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: float = 0.5, seed: int = 0, malformed: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.malformed = malformed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.images = 0
+        self.refused = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                status, headers, reply = mock.handle(body)
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = self.images = self.refused = 0
+
+    def handle(self, body: dict):
+        """Return (status, headers, JSON reply) for one chat-completions request."""
+        images = [part["image_url"] for message in body["messages"]
+                  if isinstance(message["content"], list)
+                  for part in message["content"] if part["type"] == "image_url"]
+        with self.lock:
+            self.requests += 1
+            refused = self.rng.random() < self.rate_limit
+            malformed = self.rng.random() < self.malformed
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if refused:
+                self.refused += 1
+            else:
+                self.images += len(images)
+        if refused:
+            return 429, {"retry-after-ms": str(int(self.retry_after * 1000))}, {
+                "error": {"message": "Rate limit reached for requests", "type": "requests",
+                          "param": None, "code": "rate_limit_exceeded"}}
+
+        time.sleep(delay)
+        answers, image_tokens = zip(*map(_answer, images)) if images else ((), ())
+        response_format = body.get("response_format", {}).get("type")
+        if response_format in ("json_schema", "json_object"):
+            answers = [{"EN": answer.get("EN", ""), "AR": answer.get("AR", "")} for answer in answers]
+            if len(answers) == 1:
+                content = json.dumps(answers[0], ensure_ascii=False)
+            else:
+                content = json.dumps({"images": [{"IMAGE": i, **answer} for i, answer in enumerate(answers, 1)]},
+                                     ensure_ascii=False)
+        elif len(answers) == 1:
+            content = f"```python\n{answers[0]!r}\n```"
+        else:
+            content = repr([{"IMAGE": i, **answer} for i, answer in enumerate(answers, 1)])
+        if malformed:
+            content = content[:len(content) // 2]
+        prompt_tokens = 85 + sum(image_tokens)
+        completion_tokens = 12 * len(images)
+        return 200, {}, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
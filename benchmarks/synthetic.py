@@ -0,0 +1,166 @@
+"""
+Synthetic magazines and registries for the offline benchmarks.
+
+Each logo carries its brand id as a strip of black and white cells across
+its top, wide enough to survive the grayscale, scaled payload that
+`encode_image` sends, and a frame on its outer edge so border cropping
+leaves the strip where the decoder looks for it. The mock endpoint (benchmarks/mock_openai.py) reads
+the strip back, so it answers with the brand the page really shows and a run
+can be checked for correctness as well as timed.
+
+Page text uses the category and request-number phrases of src/pattern.py,
+rendered with PyMuPDF's HTML layout so the Arabic comes out shaped into
+presentation forms, as in the real PDFs.
+"""
+import random
+from collections import Counter
+
+import cv2
+import fitz
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_similar_names import make_name
+
+ID_BITS = 16  # Cells in a logo's id strip
+LOGO_SIZE = (288, 96)  # Pixels, width x height; the strip is the top sixth
+
+
+def brand_name(brand: int) -> str:
+    """The name of brand number `brand`, the same in every process."""
+    return make_name(random.Random(brand * 7919 + 17))
+
+
+def make_logo(brand: int) -> bytes:
+    """PNG bytes of brand `brand`'s logo."""
+    width, height = LOGO_SIZE
+    image = np.full((height, width), 255, np.uint8)
+    cell = width // ID_BITS
+    for bit in range(ID_BITS):
+        if brand >> bit & 1:
+            image[:height // 6, bit * cell:(bit + 1) * cell] = 0
+    rng = random.Random(brand)
+    cv2.rectangle(image, (4, height // 6 + 6), (width - 5, height - 5), rng.randint(0, 160), 2)
+    cv2.rectangle(image, (0, 0), (width - 1, height - 1), 0, 1)
+    cv2.putText(image, f"BRAND {brand}", (14, height - 24), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def read_logo_id(gray: np.ndarray) -> int:
+    """Decode the id strip of a logo, at any scale."""
+    height, width = gray.shape
+    cell = width / ID_BITS
+    strip = gray[height // 24:height // 8]
+    brand = 0
+    for bit in range(ID_BITS):
+        center = strip[:, int(bit * cell + cell / 4):int((bit + 1) * cell - cell / 4)]
+        if center.size and center.mean() < 128:
+            brand |= 1 << bit
+    return brand
+
+
+def make_decorations(page_number: int) -> list:
+    """
+    PNG bytes of the decorative images of a page, none of them a brand: a
+    rule and an icon shared by every page (so one xref each), and a flat
+    fill that differs per page.
+    """
+    rule = np.full((30, 560), 120, np.uint8)
+    icon = np.zeros((16, 16), np.uint8)
+    cv2.circle(icon, (8, 8), 6, 255, -1)
+    fill = np.full((64, 64), 100 + page_number % 150, np.uint8)
+    return [cv2.imencode('.png', image)[1].tobytes() for image in (rule, icon, fill)]
+
+
+def make_magazine(path: str, pages: int, logos_per_page: int, brands: int, seed: int = 0,
+                  decorations: bool = True, captions: float = 0.0) -> list:
+    """
+    Write a synthetic magazine.
+
+    Args:
+        pages: Number of pages
+        logos_per_page: Logos on each page (at most 16)
+        brands: Size of the brand catalog the logos are drawn from; brands
+            repeat across pages when it is smaller than the logo count
+        decorations: Also place the images of `make_decorations` on each page
+        captions: Share of the logos with a Latin brand name that have it
+            printed right under them, as in born-digital issues (see src.text_layer)
+    Returns:
+        (category, request number, Counter of brand names) per page
+    """
+    rng = random.Random(seed)
+    caption_rng = random.Random(seed + 1)  # Same pages and logos whatever the captions
+    logos = {}
+    expected = []
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        category = str(rng.randint(1, 45))
+        request_number = str(rng.randint(10000, 999999))
+        # ASCII digits: a line of Arabic letters and Arabic-Indic digits only
+        # is laid out right to left and its text comes back reversed
+        page.insert_htmlbox(fitz.Rect(40, 30, 560, 100),
+                            f"<p>فئة {category}</p><p>قدم عنها طلب رقم : {request_number}</p>")
+        names = Counter()
+        for slot in range(min(logos_per_page, 16)):
+            brand = rng.randrange(brands)
+            if brand not in logos:
+                logos[brand] = make_logo(brand)
+            row, column = divmod(slot, 2)
+            rect = fitz.Rect(40 + column * 270, 110 + row * 88, 280 + column * 270, 190 + row * 88)
+            # Latin names only: without an Arabic font, the HTML layout garbles lam
+            if caption_rng.random() < captions and brand_name(brand).isascii():
+                rect.y1 -= 14
+                page.insert_htmlbox(fitz.Rect(rect.x0, rect.y1 + 1, rect.x1, rect.y1 + 13),
+                                    f"<p>{brand_name(brand)}</p>", css="* {font-size: 8pt; text-align: center}")
+            page.insert_image(rect, stream=logos[brand])
+            names[brand_name(brand)] += 1
+        if decorations:
+            rule, icon, fill = make_decorations(page_number)
+            page.insert_image(fitz.Rect(40, 104, 560, 106), stream=rule)
+            page.insert_image(fitz.Rect(540, 40, 556, 56), stream=icon)
+            page.insert_image(fitz.Rect(480, 780, 544, 812), stream=fill)
+        expected.append((category, request_number, names))
+    doc.save(path)
+    return expected
+
+
+def make_registry(path: str, rows: int, brands: int, seed: int = 1) -> pd.DataFrame:
+    """
+    Write a registry workbook holding every catalog brand once plus random
+    filler names, and return it.
+    """
+    rng = random.Random(seed)
+    names = [brand_name(brand) for brand in range(min(brands, rows))]
+    names += [make_name(rng) for _ in range(rows - len(names))]
+    rng.shuffle(names)
+    registry = pd.DataFrame({
+        "serial": range(rows),
+        "name": names,
+        "grp_code": [rng.randint(1, 45) for _ in range(rows)],
+        "file_no": [f"F{i:06d}" for i in range(rows)],
+    })
+    registry.to_excel(path, index=False)
+    return registry
+
+
+def check_extraction(expected: list, df: pd.DataFrame) -> dict:
+    """
+    Compare an extraction with what `make_magazine` wrote.
+
+    Returns:
+        Share of the logos read with the right brand, of the pages whose
+        category and request number were both found, and the number of
+        rows that match no logo (decorations that were sent to OCR)
+    """
+    read = {page: Counter() for page in range(1, len(expected) + 1)}
+    fields = {}
+    for ara, eng, page, category, request_number in df.itertuples(index=False, name=None):
+        read[page][(ara or '').strip() or (eng or '').strip()] += 1
+        fields[page] = (category, request_number)
+    logos = sum(sum(names.values()) for _, _, names in expected)
+    right = sum(sum((names & read[page]).values()) for page, (_, _, names) in enumerate(expected, 1))
+    pages_right = sum(fields.get(page) == (category, request_number)
+                      for page, (category, request_number, _) in enumerate(expected, 1))
+    return {"logos": right / logos if logos else 1.0, "fields": pages_right / len(expected),
+            "extra_rows": len(df) - right}
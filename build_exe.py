@@ -20,7 +20,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Pulled in through optional imports of pandas and friends, never used by the app
+    excludes=['IPython', 'jedi', 'parso', 'tornado', 'zmq', 'ipykernel', 'jupyter_client',
+              'jupyter_core', 'notebook', 'matplotlib', 'pytest'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -69,6 +71,10 @@ def create_env_template():
 OPENAI_API_KEY=your_api_key_here
 MODEL_NAME = "your model name"
 
+# Optional: where OCR results are cached between runs (default: the user's
+# cache folder, e.g. %LOCALAPPDATA%\\ocr_app\\ocr_cache.db)
+# OCR_CACHE_PATH = "C:\\path\\to\\ocr_cache.db"
+
 # Instructions:
 # 1. Rename this file to .env
 # 2. Replace 'your_api_key_here' with your actual OpenAI API key
@@ -1,7 +1,15 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from src.main import flow
+import importlib
 import multiprocessing
+import queue
+import threading
+from time import perf_counter as counter
+
+POLL_MS = 100  # How often the window picks up progress from the worker thread
+
+events = queue.Queue()  # ("progress", done, total), then ("done",) or ("error", message)
+cancel_event = threading.Event()
 
 
 def browse_file(entry_field, file_type):
@@ -23,7 +31,7 @@ def browse_directory(entry_field):
 
 
 def run_flow():
-    """Run the `flow` function with user inputs."""
+    """Start the `flow` function with user inputs on a worker thread, keeping the window responsive."""
     pdf_path = pdf_entry.get()
     excel_path = excel_entry.get()
     output_path = output_entry.get()
@@ -34,17 +42,97 @@ def run_flow():
         messagebox.showerror("Error", "Please provide all required inputs!")
         return
 
+    cancel_event.clear()
+    run_button.configure(state="disabled")
+    cancel_button.configure(state="normal")
+    progress_bar.configure(value=0, maximum=1)
+    status_var.set("Starting...")
+    threading.Thread(target=flow_worker, kwargs=dict(
+        pdf_path=pdf_path,
+        excel_path=excel_path,
+        output_path=output_path,
+        sim_cat=sim_cat,
+        threshold=threshold
+    )).start()
+    root.after(POLL_MS, poll_events, None)
+
+
+def preload_pipeline():
+    """
+    Import the pipeline (pandas, fitz, OpenCV, openai...) on a background
+    thread once the window is up, so the window does not wait for it and
+    Run usually does not either.
+    """
+    threading.Thread(target=importlib.import_module, args=("src.main",), daemon=True).start()
+
+
+def flow_worker(**inputs):
+    """Worker thread: run `flow`, reporting to the Tk thread only through the `events` queue."""
     try:
-        flow(
-            pdf_path=pdf_path,
-            excel_path=excel_path,
-            output_path=output_path,
-            sim_cat=sim_cat,
-            threshold=threshold
-        )
-        messagebox.showinfo("Success", "Flow function executed successfully!")
+        from src.main import flow
+        flow(**inputs,
+             progress=lambda done, total: events.put(("progress", done, total)),
+             cancel=cancel_event)
+        events.put(("done",))
     except Exception as e:
-        messagebox.showerror("Error", f"An error occurred: {str(e)}")
+        events.put(("error", str(e)))
+
+
+def cancel_flow():
+    """Stop the OCR workers; the pages finished so far are still matched and saved."""
+    cancel_event.set()
+    cancel_button.configure(state="disabled")
+    status_var.set("Cancelling...")
+
+
+def progress_text(done, total, first):
+    """'12/40 pages, 1.5 pages/s, ETA 0:19', rated from the first progress report `first` = (time, done)."""
+    if done >= total:
+        return f"{done}/{total} pages, matching names..."
+    text = f"{done}/{total} pages"
+    elapsed = counter() - first[0]
+    if done > first[1] and elapsed > 0:
+        rate = (done - first[1]) / elapsed
+        eta = int((total - done) / rate)
+        text += f", {rate:.1f} pages/s, ETA {eta // 60}:{eta % 60:02d}"
+    return text
+
+
+def poll_events(first):
+    """Apply the worker thread's progress to the window, every POLL_MS until the flow ends."""
+    result = None
+    while not events.empty():
+        event = events.get_nowait()
+        if event[0] == "progress":
+            _, done, total = event
+            if first is None:
+                first = (counter(), done)
+            progress_bar.configure(maximum=max(total, 1), value=done)
+            if not cancel_event.is_set():
+                status_var.set(progress_text(done, total, first))
+        else:
+            result = event
+    if result is None:
+        root.after(POLL_MS, poll_events, first)
+        return
+
+    run_button.configure(state="normal")
+    cancel_button.configure(state="disabled")
+    if result[0] == "error":
+        status_var.set("Failed")
+        messagebox.showerror("Error", f"An error occurred: {result[1]}")
+    elif cancel_event.is_set():
+        status_var.set("Cancelled")
+        messagebox.showinfo("Cancelled", "Flow cancelled; the results finished so far were saved.")
+    else:
+        status_var.set("Done")
+        messagebox.showinfo("Success", "Flow function executed successfully!")
+
+
+def on_close():
+    """Closing the window cancels a running flow, which then saves what it has."""
+    cancel_event.set()
+    root.destroy()
 
 
 def toggle_theme():
@@ -147,13 +235,25 @@ if __name__ =='__main__':
 
     # إضافة Progress Bar
     progress_bar = ttk.Progressbar(main_frame, orient="horizontal", length=400, mode="determinate")
-    progress_bar.grid(row=5, column=1, padx=10, pady=20, sticky="ew")
-    
+    progress_bar.grid(row=5, column=1, padx=10, pady=(20, 0), sticky="ew")
+    status_var = tk.StringVar(value="")
+    tk.Label(main_frame, textvariable=status_var, font=default_font, bg="#F5F5F5").grid(row=6, column=1, padx=10, sticky="w")
+
     # Run Button
     run_button = tk.Button(
         main_frame, text="Run Flow", font=("Arial", 12), bg="#0078D4", fg="white", command=run_flow
     )
-    run_button.grid(row=6, column=1, pady=20, sticky="ew")
+    run_button.grid(row=7, column=1, pady=20, sticky="ew")
+
+    # Cancel Button
+    cancel_button = tk.Button(
+        main_frame, text="Cancel", font=("Arial", 12), bg="#0078D4", fg="white", command=cancel_flow,
+        state="disabled"
+    )
+    cancel_button.grid(row=7, column=2, padx=10, pady=20)
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    root.after(0, preload_pipeline)
 
     # Start the Tkinter event loop
     root.mainloop()
\ No newline at end of file
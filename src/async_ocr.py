@@ -0,0 +1,258 @@
+import asyncio
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import fitz
+import pandas as pd
+
+from src.extracting_images import enumerate_pages, read_xrefs, print_cache_summary, RESULT_COLUMNS, _UNREAD
+from src.image_filter import print_filter_summary
+from src.text_layer import print_text_layer_summary
+from src.dedup import LogoClusters
+from src.journal import Journal
+from src.metrics import get_metrics
+from src.output_sink import RowSink
+from src.ocr_cache import get_cache
+from src.open_ocr import get_OCR_batch_async, get_names, batch_limits, OCR_BATCH_RETRIES
+from src.pdf_worker import (init_worker, image_chunks, share_pdf, release_pdf, stop_pool, worker_pids,
+                            CANCEL_POLL_SECONDS)
+from src.rate_limiter import call_with_limits_async
+
+# Number of OCR requests in flight at once (overridable with OCR_CONCURRENCY);
+# the shared rate limiter still decides when each one may be sent, and each
+# request may carry several images (see OCR_BATCH_SIZE)
+OCR_CONCURRENCY = 8
+
+
+async def ocr_worker(queue: asyncio.Queue, async_client, retries: int):
+    """
+    Take queued images and OCR them, packing as many as are waiting into one
+    request (up to the batch limits). Images a reply did not cover go back to
+    the queue; on their last retry round they are sent alone.
+
+    Queue items are (base64 image, future for its answer, attempt).
+    """
+    batch_size, max_bytes = batch_limits()
+    while True:
+        batch = [await queue.get()]
+        batch_bytes = len(batch[0][0])
+        alone = 0 < batch[0][2] == retries
+        while not alone and len(batch) < batch_size and not queue.empty():
+            item = queue.get_nowait()
+            if 0 < item[2] == retries or batch_bytes + len(item[0]) > max_bytes:
+                queue.put_nowait(item)
+                break
+            batch.append(item)
+            batch_bytes += len(item[0])
+
+        payloads = [payload for payload, _, _ in batch]
+        try:
+            answers = await call_with_limits_async(get_OCR_batch_async, async_client, payloads,
+                                                   weight=len(payloads))
+        except Exception as e:
+            print(f"OCR failed for {len(batch)} images: {e}")
+            answers = [None] * len(batch)
+            retries_left = False
+        else:
+            retries_left = True
+
+        for (payload, future, attempt), answer in zip(batch, answers):
+            if answer is None and retries_left and attempt < retries:
+                queue.put_nowait((payload, future, attempt + 1))
+            else:
+                future.set_result(answer)
+
+
+async def _extract(pdf_path: str, max_workers: int, concurrency: int, chunk_size: int, journal: Journal,
+                   sink: RowSink = None, executor: ProcessPoolExecutor = None, progress=None, cancel=None):
+    with fitz.open(pdf_path) as doc:
+        total_pages = len(doc)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cache = get_cache()
+    model = os.getenv("MODEL_NAME")
+    finished = journal.done_pages()
+    if finished:
+        print(f"Resuming: {len(finished)} of {total_pages} pages already done")
+        if sink is not None:
+            sink.write(journal.results(complete_only=True))
+    page_tasks = []
+    clusters = LogoClusters()
+    in_flight = {}  # cluster -> future
+    done = len(finished)
+    if progress:
+        progress(done, total_pages)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    from openai import AsyncOpenAI
+
+    async with AsyncOpenAI(max_retries=0) as async_client:
+        retries = int(os.getenv("OCR_BATCH_RETRIES", OCR_BATCH_RETRIES))
+        workers = [asyncio.ensure_future(ocr_worker(queue, async_client, retries)) for _ in range(concurrency)]
+
+        async def resolve(base64_image):
+            answer = loop.create_future()
+            queue.put_nowait((base64_image, answer, 0))
+            return await answer
+
+        async def finish_page(page_number, category, request_number, entries):
+            # Commit the page to the journal once all its images are read and answered
+            nonlocal done
+            names = []
+            complete = True
+            for entry in entries:
+                if isinstance(entry, asyncio.Future):
+                    entry = await entry
+                if entry is None:  # skipped by the image filter
+                    continue
+                if entry is _UNREAD:
+                    complete = False
+                    continue
+                cache_key, ocr_data = entry
+                if isinstance(ocr_data, asyncio.Future):
+                    ocr_data = await ocr_data
+                    if ocr_data is None:
+                        complete = False
+                        continue
+                    cache.put(cache_key, ocr_data, model)
+                eng, ara = get_names(ocr_data)
+                names.append((ara, eng))
+            journal.record_page(page_number, category, request_number, names, complete)
+            if sink is not None:
+                sink.write([(ara, eng, page_number + 1, category, request_number) for ara, eng in names])
+            done += 1
+            if progress:
+                progress(done, total_pages)
+
+        # OCR requests start as soon as their image is read, while the
+        # workers keep reading the others
+        pids = worker_pids(max_workers) if executor is None else None  # Only a pool of our own is terminated
+        pdf_source, shm = share_pdf(pdf_path)
+        try:
+            with (nullcontext(executor) if executor else
+                  ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                      initargs=(pdf_source, None, get_metrics(), pids))) as executor:
+                # First level: list the images of the pages not done yet (it blocks, so off the loop)
+                enumerated, named, enumerations = await asyncio.to_thread(
+                    enumerate_pages, executor, pdf_source, total_pages, chunk_size, finished, cancel)
+                page_xrefs = [xrefs for _, _, _, xrefs, _ in enumerated]
+                chunks, repeats = image_chunks(page_xrefs, skip=named)
+                get_metrics().count("xref_repeats", repeats)
+                occurrences = Counter(xref for xrefs in page_xrefs for xref in xrefs)
+
+                # xref -> (cache_key, ocr dict or cluster future), None if skipped, _UNREAD;
+                # a future until its read task returns
+                read = {xref: (None, ocr_data) for xref, ocr_data in named.items()}
+                read.update((xref, loop.create_future()) for chunk in chunks for xref in chunk)
+                for page_number, category, request_number, xrefs, _ in enumerated:
+                    page_tasks.append(asyncio.ensure_future(
+                        finish_page(page_number, category, request_number, [read[xref] for xref in xrefs])))
+
+                # Second level: read, fingerprint and encode the distinct images
+                # in small tasks, largest pages first
+                read_futures = [loop.run_in_executor(executor, read_xrefs, chunk, pdf_source)
+                                for chunk in chunks]
+
+                async def read_chunk(chunk, future):
+                    try:
+                        return chunk, await future
+                    except Exception as e:
+                        print(f"Error reading {len(chunk)} images: {e}")
+                        return chunk, [_UNREAD] * len(chunk)
+
+                for next_chunk in asyncio.as_completed([read_chunk(*task) for task in zip(chunks, read_futures)]):
+                    if cancelled():
+                        break
+                    chunk, results = await next_chunk
+                    for xref, result in zip(chunk, results):
+                        if result is None or result is _UNREAD:
+                            read[xref].set_result(result)
+                            continue
+                        cache_key, ocr_data, image_print, base64_image = result
+                        if ocr_data is None:
+                            # Dedup stage: near-identical logos from any page share one request
+                            cluster = clusters.add(image_print) if image_print else clusters.new_cluster()
+                            clusters.members[cluster] += occurrences[xref] - 1
+                            if cluster not in in_flight:
+                                in_flight[cluster] = asyncio.ensure_future(resolve(base64_image))
+                            ocr_data = in_flight[cluster]
+                        read[xref].set_result((cache_key, ocr_data))
+                if cancelled():
+                    stop_pool(executor, enumerations + read_futures, pids)
+        finally:
+            release_pdf(shm)
+
+        # Pages finish as their answers arrive; on cancel the rest are dropped
+        waiting = set(page_tasks)
+        while waiting and not cancelled():
+            _, waiting = await asyncio.wait(waiting, timeout=CANCEL_POLL_SECONDS)
+        for task in waiting:
+            task.cancel()
+        if cancelled():
+            print(f"Cancelled: {len(journal.done_pages())} of {total_pages} pages finished")
+
+        for worker in workers:
+            worker.cancel()
+    if clusters.members:
+        print(clusters.summary())
+
+
+def extract_async(pdf_path: str, output_folder: str, max_workers: int = None,
+                  concurrency: int = None, chunk_size: int = None, resume: bool = False,
+                  sink: RowSink = None, executor: ProcessPoolExecutor = None, progress=None,
+                  cancel=None) -> pd.DataFrame:
+    """
+    Extract information from PDF, keeping page parsing and OCR apart
+
+    Worker processes only parse pages and encode images; one event loop in
+    this process sends the OCR requests concurrently, so throughput follows
+    the API quota instead of the number of cores blocked on the network.
+    The workers are scheduled as in `extract`: a fast pass lists each
+    page's images, then the distinct images are read and encoded in small
+    tasks, largest pages first, each one queued for OCR as soon as it is
+    ready.
+
+    Args:
+        pdf_path: Path to PDF file
+        output_folder: Output folder for any necessary files
+        max_workers: Number of page-parsing processes
+        concurrency: Maximum number of OCR requests in flight
+        chunk_size: Pages per enumeration task (default PAGE_CHUNK_SIZE);
+            image tasks hold IMAGE_CHUNK_SIZE images
+        resume: Skip the pages an interrupted run already committed to the
+            journal (see `extract`)
+        sink: Optional writer the rows are streamed to as pages complete
+        executor: Optional parsing pool shared by several PDFs, left running
+            (the OCR client is bound to this call's event loop and is not shared)
+        progress: Optional callback progress(done_pages, total_pages)
+        cancel: Optional threading.Event; once set, pending requests are
+            dropped and the pages finished so far are returned
+    Returns:
+        DataFrame containing extracted information
+    """
+    max_workers = max_workers or max(1, multiprocessing.cpu_count() - 1)
+    concurrency = concurrency or int(os.getenv("OCR_CONCURRENCY", OCR_CONCURRENCY))
+
+    cache = get_cache()
+    cache.evict()
+    cache_before = cache.stats()
+    counters_before = get_metrics().counters()
+
+    journal = Journal(pdf_path, output_folder)
+    if not resume:
+        journal.reset()
+    asyncio.run(_extract(pdf_path, max_workers, concurrency, chunk_size, journal, sink, executor,
+                         progress, cancel))
+    results = journal.results()
+    journal.close()
+
+    print_filter_summary(counters_before, get_metrics().counters())
+    print_text_layer_summary(counters_before, get_metrics().counters())
+    print_cache_summary(cache_before, cache.stats())
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
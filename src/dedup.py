@@ -0,0 +1,126 @@
+import os
+
+import cv2
+import numpy as np
+
+# Defaults for perceptual deduplication; each one can be overridden from the
+# .env file (DEDUP_MAX_DISTANCE, DEDUP_MAX_PIXEL_DIFF, DEDUP_MAX_ASPECT_DIFF)
+DEDUP_MAX_DISTANCE = 10  # dHash bits that may differ; negative disables dedup
+DEDUP_MAX_PIXEL_DIFF = 32  # Worst 8x8 cell of the thumbnail difference, in gray levels
+DEDUP_MAX_ASPECT_DIFF = 0.1  # Relative width/height difference
+
+HASH_SIZE = 8  # 64-bit dHash
+THUMB_SIZE = (64, 32)  # (width, height) of the verification thumbnail
+CELL_GRID = (8, 8)  # (rows, columns) of cells compared on the thumbnail
+
+
+def fingerprint(image):
+    """
+    Perceptual fingerprint of an encoded image.
+
+    The difference hash (sign of the horizontal gradient on a 9x8 thumbnail)
+    finds candidate duplicates quickly, but on text-only logos it cannot tell
+    "BRAND1" from "BRAND3". The contrast-stretched 64x32 thumbnail is what
+    confirms a match: a rescaled or re-encoded copy differs a little
+    everywhere, a different logo differs a lot somewhere.
+
+    Returns:
+        (hash as int, width / height, thumbnail bytes), or None if the image
+        cannot be decoded
+    """
+    gray = cv2.imdecode(np.frombuffer(memoryview(image), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None or gray.size == 0:
+        return None
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    thumb = cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    thumb = cv2.normalize(thumb, None, 0, 255, cv2.NORM_MINMAX)
+    return value, gray.shape[1] / gray.shape[0], thumb.tobytes()
+
+
+def thumbnail_distance(a: bytes, b: bytes) -> float:
+    """Mean gray-level difference of the most different cell of two thumbnails."""
+    width, height = THUMB_SIZE
+    rows, cols = CELL_GRID
+    diff = np.abs(np.frombuffer(a, np.uint8).astype(np.int16) - np.frombuffer(b, np.uint8))
+    cells = diff.reshape(rows, height // rows, cols, width // cols).mean(axis=(1, 3))
+    return float(cells.max())
+
+
+class LogoClusters:
+    """
+    Groups image fingerprints into clusters of near-identical logos.
+
+    Each cluster is represented by its first image; a new image joins the
+    first cluster whose representative has a close hash, a similar aspect
+    ratio and a matching thumbnail. Representatives are indexed by
+    `max_distance + 1` bit bands of their hash: two hashes within the
+    distance share at least one band exactly, so only those are compared.
+    """
+
+    def __init__(self, max_distance: int = None, max_pixel_diff: float = None,
+                 max_aspect_diff: float = None):
+        if max_distance is None:
+            max_distance = int(os.getenv("DEDUP_MAX_DISTANCE", DEDUP_MAX_DISTANCE))
+        self.max_distance = max_distance
+        self.max_pixel_diff = max_pixel_diff or float(os.getenv("DEDUP_MAX_PIXEL_DIFF", DEDUP_MAX_PIXEL_DIFF))
+        self.max_aspect_diff = max_aspect_diff or float(os.getenv("DEDUP_MAX_ASPECT_DIFF", DEDUP_MAX_ASPECT_DIFF))
+        bands = min(HASH_SIZE * HASH_SIZE, max(1, self.max_distance + 1))
+        self.band_width = -(-HASH_SIZE * HASH_SIZE // bands)
+        self.band_mask = (1 << self.band_width) - 1
+        self.bands = [{} for _ in range(bands)]
+        self.representatives = []  # fingerprint per cluster id
+        self.members = []  # number of images per cluster id
+
+    def _band_keys(self, value: int):
+        for band in range(len(self.bands)):
+            yield band, (value >> (band * self.band_width)) & self.band_mask
+
+    def _matches(self, fingerprint, representative) -> bool:
+        value, aspect, thumb = fingerprint
+        rep_value, rep_aspect, rep_thumb = representative
+        return (bin(value ^ rep_value).count("1") <= self.max_distance
+                and abs(aspect - rep_aspect) <= self.max_aspect_diff * max(aspect, rep_aspect)
+                and thumbnail_distance(thumb, rep_thumb) <= self.max_pixel_diff)
+
+    def add(self, fingerprint) -> int:
+        """
+        Assign a fingerprint to a cluster.
+
+        Returns:
+            The cluster id; a new id means the image is a new representative
+        """
+        if self.max_distance >= 0:
+            seen = set()
+            for band, key in self._band_keys(fingerprint[0]):
+                for cluster in self.bands[band].get(key, ()):
+                    if cluster in seen:
+                        continue
+                    seen.add(cluster)
+                    if self._matches(fingerprint, self.representatives[cluster]):
+                        self.members[cluster] += 1
+                        return cluster
+
+        cluster = len(self.representatives)
+        self.representatives.append(fingerprint)
+        self.members.append(1)
+        for band, key in self._band_keys(fingerprint[0]):
+            self.bands[band].setdefault(key, []).append(cluster)
+        return cluster
+
+    def new_cluster(self) -> int:
+        """Open a cluster for an image without fingerprint (it is never matched)."""
+        self.representatives.append((0, 0.0, b""))
+        self.members.append(1)
+        return len(self.representatives) - 1
+
+    @property
+    def saved(self) -> int:
+        """Number of images answered by another image's OCR result."""
+        return sum(self.members) - len(self.members)
+
+    def summary(self) -> str:
+        return (f"Dedup: {sum(self.members)} images in {len(self.members)} clusters, "
+                f"{self.saved} OCR requests saved")
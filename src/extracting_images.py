@@ -1,47 +1,37 @@
 import fitz
 import re
-import numpy as np
-from src.open_ocr import get_names,get_OCR
-import pandas as pd
+from src.open_ocr import get_names,get_OCR_batch_with_usage,encode_image,ocr_in_batches,batch_limits
 import os
-from time import perf_counter as counter
 from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import multiprocessing
-import pandas as pd
-from typing import Tuple, List
-import tempfile
-import time
-import openai
+from typing import Tuple, List, TYPE_CHECKING
 from src.pattern import patterns, pattern_req
+from src.ocr_cache import get_cache
+from src.rate_limiter import RateLimiter, call_with_limits
+from src.metrics import get_metrics
+from src.image_filter import get_filter, print_filter_summary
+from src.text_layer import get_text_layer, print_text_layer_summary
+from src.pdf_worker import (init_worker, worker_document, worker_memo, page_ranges, share_pdf, release_pdf,
+                            completed, stop_pool, worker_pids, largest_first, image_chunks,
+                            IMAGE_CHUNK_SIZE)
+from src.dedup import LogoClusters, fingerprint
+from src.text_fields import extract_fields
+from src.journal import Journal
 
-# Global variables to track requests and implement throttling
-REQUESTS_PER_MINUTE = 13  # Safety margin to avoid hitting the limit
-REQUEST_INTERVAL = 60 / REQUESTS_PER_MINUTE  # Interval between requests in seconds
-last_request_time = 0  # To track the time of the last request
+# Worker processes import this module for their tasks; pandas and the output
+# sinks are only used by the main process, which imports them when it runs
+if TYPE_CHECKING:
+    import pandas as pd
+    from src.output_sink import RowSink
 
-def throttled_get_OCR(temp_filename: str) -> dict:
-    """
-    Throttled wrapper for get_OCR with retry mechanism.
-    """
-    global last_request_time
+RESULT_COLUMNS = ["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page_Number", "Magazine_Category_id","Request Number"]
 
-    # Throttle requests
-    time_since_last_request = time.time() - last_request_time
-    if time_since_last_request < REQUEST_INTERVAL:
-        time.sleep(REQUEST_INTERVAL - time_since_last_request)
+_UNREAD = object()  # an image whose read task failed; its page is left incomplete
 
-    while True:
-        try:
-            # Call the API
-            ocr_data = get_OCR(temp_filename)
-            last_request_time = time.time()  # Update the last request time
-            return ocr_data
-        except openai.RateLimitError as e:
-            print(f"Rate limit reached: {e}. Retrying after 2 seconds...")
-            time.sleep(2)  # Retry after a short delay
-        except Exception as e:
-            print(f"Unexpected error during OCR: {e}")
-            raise  # Re-raise unexpected errors
+def throttled_get_OCR_batch(base64_images: List[str]) -> List[dict]:
+    """Throttled wrapper for get_OCR_batch_with_usage; one dict (or None) per image."""
+    return call_with_limits(get_OCR_batch_with_usage, base64_images, weight=len(base64_images))
 
 
 def reconstruct_arabic_text(text):
@@ -73,158 +63,418 @@ def extract_request_number(text):
     
 
 
-def process_single_page(args: Tuple[str, int, str]) -> List[Tuple[str, str, int, str]]:
-    pdf_path, page_number, output_folder = args
-    results = []
-    try:
-        # print(f"Processing page {page_number + 1} of {pdf_path}...")
-        doc = fitz.open(pdf_path)
+def print_cache_summary(before: dict, after: dict):
+    """Print the OCR cache hits and misses of one run."""
+    hits = after['hits'] - before['hits']
+    misses = after['misses'] - before['misses']
+    total = hits + misses
+    rate = 100 * hits / total if total else 0
+    print(f"OCR cache: {hits} hits, {misses} misses ({rate:.1f}% hit rate), {after['entries']} entries stored")
+
+
+def page_xrefs(doc: fitz.Document, page_number: int, known=()) -> Tuple[str, str, List[int], dict]:
+    """
+    Return the category, request number, the xrefs of the images worth
+    reading (see src.image_filter) and the OCR-style dicts of those named
+    by the page text (see src.text_layer). Xrefs in `known` are already
+    answered and are not looked up in the text.
+    """
+    metrics = get_metrics()
+    with metrics.timer("page_parse"):
         page = doc[page_number]
-        
+
         # Extract text and category
-        text = page.get_text()
-        category = extract_cat(text)
-        request_number = extract_request_number(text)
-        
-        # Get images
-        images = page.get_images()
-        # print(f"Found {len(images)} images on page {page_number + 1}.")
-        
-        for img_idx, img in enumerate(images):
-            xref = img[0]
-            img_info = doc.extract_image(xref)
-            
-            with tempfile.NamedTemporaryFile(suffix=f".{img_info['ext']}", delete=False) as temp_file:
-                temp_filename = temp_file.name
-                temp_file.write(img_info['image'])
-            
-            try:
-                ocr_data = throttled_get_OCR(temp_filename)
-                eng, ara = get_names(ocr_data)
-                results.append((ara, eng, page_number + 1, category,request_number))
-            except Exception as ocr_error:
-                print(f"OCR failed for file {temp_filename}: {ocr_error}")
-                traceback.print_exc()
-                raise               
-            finally:
-                if os.path.exists(temp_filename):
-                    os.remove(temp_filename)
-        doc.close()
-    except Exception as e:
-        print(f"Error processing page {page_number + 1}: {e}")
-        traceback.print_exc()
+        category, request_number = extract_fields(page.get_text())
+        xrefs = get_filter().keep_xrefs(page.get_images(), metrics)
+        named = get_text_layer().names(page, [xref for xref in xrefs if xref not in known], metrics)
+    return category, request_number, xrefs, named
+
+
+def extract_xref(doc: fitz.Document, xref: int) -> bytes:
+    """Raw bytes of one image, or None when the image filter skips it."""
+    metrics = get_metrics()
+    with metrics.timer("image_extract"):
+        image = doc.extract_image(xref)['image']
+    return image if get_filter().keep_bytes(image, metrics) else None
+
+
+def enumerate_page_range(page_range: Tuple[int, int], source=None) -> list:
+    """
+    First level of the scheduler, run in a worker with the document opened
+    in `init_worker` (or `source`, when the pool is shared by several PDFs):
+    the fields, image xrefs and text-layer names of each page, without
+    reading any image. An xref this worker has already enumerated is not
+    looked up in the text again.
+
+    Returns:
+        (page_number, category, request_number, xrefs, named) per page
+    """
+    doc = worker_document(source)
+    seen = worker_memo("enumerate")
+    pages = []
+    for page_number in range(*page_range):
+        try:
+            category, request_number, xrefs, named = page_xrefs(doc, page_number, seen)
+        except Exception as e:
+            print(f"Error processing page {page_number + 1}: {e}")
+            traceback.print_exc()
+            continue
+        seen.update(dict.fromkeys(xrefs))
+        pages.append((page_number, category, request_number, xrefs, named))
+    return pages
+
+
+def read_xrefs(xrefs: List[int], source=None) -> list:
+    """
+    Second level of the scheduler, run in a worker: read the given images,
+    answer those the cache already knows, and fingerprint and encode the
+    others, so the OCR step neither reads nor looks them up again.
+
+    Returns:
+        Per xref, None when the image filter skips it or it cannot be read,
+        else (cache_key, cached ocr dict or None, fingerprint or None,
+        base64 payload or None)
+    """
+    doc = worker_document(source)
+    cache = get_cache()
+    model = os.getenv("MODEL_NAME")
+    results = []
+    for xref in xrefs:
+        try:
+            image = extract_xref(doc, xref)
+            if image is None:
+                results.append(None)
+                continue
+            cache_key = cache.key(image, model)
+            ocr_data = cache.get(cache_key)
+            if ocr_data is not None:
+                results.append((cache_key, ocr_data, None, None))
+            else:
+                results.append((cache_key, None, fingerprint(image), encode_image(image)))
+        except Exception as e:
+            print(f"Could not read image {xref}: {e}")
+            results.append(None)
     return results
 
-def extract(pdf_path: str, output_folder: str) -> pd.DataFrame:
+
+def enumerate_pages(executor, pdf_source, total_pages: int, chunk_size: int = None, skip=(), cancel=None):
+    """
+    Run the first level of the scheduler over the pages not in `skip`.
+
+    Returns:
+        (pages, named, futures): the pages as returned by
+        `enumerate_page_range`, largest first (ties in page order); the
+        text-layer names of all their xrefs; and the submitted futures
+    """
+    futures = {executor.submit(enumerate_page_range, r, pdf_source): i
+               for i, r in enumerate(page_ranges(total_pages, chunk_size, skip))}
+    enumerated = {}
+    for future in completed(futures, cancel):
+        try:
+            enumerated[futures[future]] = future.result()
+        except Exception as e:
+            print(f"Error processing pages: {e}")
+    pages = [page for i in sorted(enumerated) for page in enumerated[i]]
+    pages = [pages[i] for i in largest_first([xrefs for _, _, _, xrefs, _ in pages])]
+    # A repeated xref is only looked up on the first page its worker saw it on
+    named = {}
+    for *_, page_named in pages:
+        named.update(page_named)
+    return pages, named, list(futures)
+
+
+def ocr_payloads(payloads: List[str]) -> List[dict]:
+    """
+    Second pass, run in a worker: OCR cluster representatives that
+    `read_xrefs` already read, looked up in the cache and encoded, packed
+    OCR_BATCH_SIZE images per request. Their answers are cached by `record_page`.
+
+    Returns:
+        One OCR dict per payload, None where OCR failed
+    """
+    answers = ocr_in_batches(dict(enumerate(payloads)), throttled_get_OCR_batch)
+    if len(answers) < len(payloads):
+        print(f"OCR failed for {len(payloads) - len(answers)} images")
+    return [answers.get(i) for i in range(len(payloads))]
+
+
+def cluster_images(pages: list) -> Tuple[LogoClusters, List[int]]:
+    """
+    Dedup stage: assign every image the cache could not answer to a cluster
+    of near-identical logos, in place. An xref repeated on several pages is
+    the same image and joins its cluster without comparing fingerprints.
+
+    Args:
+        pages: (page_number, category, request_number, images) per page,
+            each image being (xref, cache_key, known ocr dict or None,
+            fingerprint or None); the third field of each pending image is
+            replaced by its cluster id
+    Returns:
+        (clusters, xref of each cluster's representative)
+    """
+    clusters = LogoClusters()
+    representatives = []
+    cluster_of_xref = {}
+    for page_number, category, request_number, images in pages:
+        for i, (xref, cache_key, ocr_data, image_print) in enumerate(images):
+            if ocr_data is not None:
+                continue
+            if xref in cluster_of_xref:
+                cluster = cluster_of_xref[xref]
+                clusters.members[cluster] += 1
+            else:
+                cluster = clusters.add(image_print) if image_print else clusters.new_cluster()
+                cluster_of_xref[xref] = cluster
+                if cluster == len(representatives):
+                    representatives.append(xref)
+            images[i] = (xref, cache_key, cluster, None)
+    return clusters, representatives
+
+
+def record_page(journal: Journal, page: tuple, answers: dict, cache, model: str, sink: "RowSink" = None):
+    """
+    Fan the cluster answers out to every image of a scanned page, cache the
+    new ones, commit the page to the journal and stream its rows to `sink`.
+    """
+    page_number, category, request_number, images = page
+    names = []
+    complete = True
+    for xref, cache_key, ocr_data, _ in images:
+        if ocr_data is _UNREAD:
+            complete = False
+            continue
+        if isinstance(ocr_data, int):
+            ocr_data = answers.get(ocr_data)
+            if ocr_data is None:
+                complete = False
+                continue
+            # Near-duplicates are stored under their own bytes too
+            cache.put(cache_key, ocr_data, model)
+        eng, ara = get_names(ocr_data)
+        names.append((ara, eng))
+    journal.record_page(page_number, category, request_number, names, complete)
+    if sink is not None:
+        sink.write([(ara, eng, page_number + 1, category, request_number) for ara, eng in names])
+
+
+def extract(pdf_path: str, output_folder: str, chunk_size: int = None, progress=None,
+            resume: bool = False, sink: "RowSink" = None, executor: ProcessPoolExecutor = None,
+            cancel=None) -> "pd.DataFrame":
     """
     Extract information from PDF with parallel processing
-    
+
+    Every worker opens the document once. Work is scheduled in two levels:
+    a fast pass over contiguous page ranges reads the text and lists each
+    page's images, then the distinct images are read, fingerprinted and
+    encoded in small tasks, largest pages first, so dense pages are spread over all
+    the workers. Near-identical logos from anywhere in the document are
+    then clustered, and only one representative per cluster is sent to OCR,
+    in the same order. Its result is fanned out to every image of the
+    cluster.
+
+    Each page is committed to a journal in the output folder as soon as all
+    its images are answered, and the DataFrame is rebuilt from the journal.
+
     Args:
         pdf_path: Path to PDF file
         output_folder: Output folder for any necessary files
+        chunk_size: Pages per enumeration task, default PAGE_CHUNK_SIZE;
+            image tasks hold IMAGE_CHUNK_SIZE images
+        progress: Optional callback progress(done_pages, total_pages),
+            called as pages are completed
+        resume: Skip the pages an earlier, interrupted run of the same PDF
+            already finished, instead of starting over
+        sink: Optional writer the rows are streamed to as pages complete
+            (in completion order, resumed pages first)
+        executor: Optional long-lived pool started with `init_worker` and no
+            document, shared by several PDFs; it is left running
+        cancel: Optional threading.Event; once set, the pool is stopped
+            and only the pages finished so far are returned (they stay in
+            the journal, so the run can be resumed)
     Returns:
         DataFrame containing extracted information
     """
-    start = counter()
-    
+    import pandas as pd
+
     # Get total pages without keeping document open
     with fitz.open(pdf_path) as doc:
         total_pages = len(doc)
-    
-    # Prepare arguments for parallel processing
-    page_args = [
-        (pdf_path, page_num, output_folder)
-        for page_num in range(total_pages)
-    ]
-    
+
+    cache = get_cache()
+    cache.evict()
+    cache_before = cache.stats()
+    counters_before = get_metrics().counters()
+    model = os.getenv("MODEL_NAME")
+
     # Calculate optimal number of workers
     max_workers = max(1, multiprocessing.cpu_count() - 1)
-    
-    # Process pages in parallel
-    results = []
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        
-        # Submit all jobs
-        for args in page_args:
-            future = executor.submit(process_single_page, args)
-            futures.append(future)
-        
-        # Collect results as they complete
-        for future in futures:
-            try:
-                page_results = future.result()
-                results.extend(page_results)
-            except Exception as e:
-                print(f"Error processing page: {e}")
-    
+
+    journal = Journal(pdf_path, output_folder)
+    if not resume:
+        journal.reset()
+    finished = journal.done_pages()
+    if finished:
+        print(f"Resuming: {len(finished)} of {total_pages} pages already done")
+        if sink is not None:
+            sink.write(journal.results(complete_only=True))
+
+    answers = {}  # cluster -> ocr dict
+    pids = worker_pids(max_workers) if executor is None else None  # Only a pool of our own is terminated
+    pdf_source, shm = share_pdf(pdf_path)
+    try:
+        with (nullcontext(executor) if executor else
+              ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                  initargs=(pdf_source, RateLimiter(), get_metrics(), pids))) as executor:
+            # First level: list the images of the pages not done yet
+            enumerated, named, enumerations = enumerate_pages(executor, pdf_source, total_pages, chunk_size,
+                                                              finished, cancel)
+            chunks, repeats = image_chunks([xrefs for _, _, _, xrefs, _ in enumerated], skip=named)
+            get_metrics().count("xref_repeats", repeats)
+
+            # Second level: read, fingerprint and encode the distinct images in small tasks
+            reads = {executor.submit(read_xrefs, chunk, pdf_source): chunk
+                     for chunk in chunks if not (cancel is not None and cancel.is_set())}
+            read = {xref: (None, ocr_data, None, None) for xref, ocr_data in named.items()}
+            for future in completed(reads, cancel):
+                try:
+                    read.update(zip(reads[future], future.result()))
+                except Exception as e:
+                    print(f"Error reading {len(reads[future])} images: {e}")
+                    read.update((xref, _UNREAD) for xref in reads[future])
+            # A page with an image that could not be read is recorded incomplete,
+            # so a resumed run retries it; pages not read before a cancel are left out
+            pages = [(page_number, category, request_number,
+                      [(xref, None, _UNREAD, None) if read[xref] is _UNREAD else (xref, *read[xref][:3])
+                       for xref in xrefs if read[xref] is not None])
+                     for page_number, category, request_number, xrefs, _ in enumerated
+                     if all(xref in read for xref in xrefs)]
+
+            # Largest pages first here too, numbered the same on every run
+            clusters, representatives = cluster_images(pages)
+            if representatives:
+                print(clusters.summary())
+            # Only the representatives' payloads are sent
+            payloads = [read[xref][3] for xref in representatives]
+            del read
+
+            # Pages still waiting for each cluster, to report progress per page
+            waiting = {}
+            remaining = []
+            for index, (_, _, _, images) in enumerate(pages):
+                needed = {ocr_data for _, _, ocr_data, _ in images if isinstance(ocr_data, int)}
+                for cluster in needed:
+                    waiting.setdefault(cluster, []).append(index)
+                remaining.append(needed)
+                if not needed:
+                    record_page(journal, pages[index], answers, cache, model, sink)
+            # Only pages actually finished count; a failed or cancelled enumeration
+            # leaves the rest out of `pages`
+            done = len(finished) + sum(1 for needed in remaining if not needed)
+            if progress:
+                progress(done, total_pages)
+
+            # Second pass: OCR the representatives in parallel
+            task_size = max(int(os.getenv("IMAGE_CHUNK_SIZE", IMAGE_CHUNK_SIZE)), batch_limits()[0])
+            futures = {}
+            for first in range(0, len(representatives), task_size):
+                if cancel is not None and cancel.is_set():
+                    break
+                cluster_ids = range(first, min(first + task_size, len(representatives)))
+                futures[executor.submit(ocr_payloads, [payloads[c] for c in cluster_ids])] = cluster_ids
+            for future in completed(futures, cancel):
+                cluster_ids = futures[future]
+                try:
+                    answers.update(zip(cluster_ids, future.result()))
+                except Exception as e:
+                    print(f"OCR failed for {len(cluster_ids)} images: {e}")
+                for cluster in cluster_ids:
+                    for index in waiting.get(cluster, ()):
+                        remaining[index].discard(cluster)
+                        if not remaining[index]:
+                            record_page(journal, pages[index], answers, cache, model, sink)
+                            done += 1
+                            if progress:
+                                progress(done, total_pages)
+
+            if cancel is not None and cancel.is_set():
+                print(f"Cancelled: {len(journal.done_pages())} of {total_pages} pages finished")
+                stop_pool(executor, enumerations + list(reads) + list(futures), pids)
+    finally:
+        release_pdf(shm)
+
+    results = journal.results()
+    journal.close()
+
     # Create DataFrame
     if results:
-        df = pd.DataFrame(results, 
-                         columns=["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page_Number", "Magazine_Category_id","Request Number"])
+        df = pd.DataFrame(results,
+                         columns=RESULT_COLUMNS)
     else:
-        df = pd.DataFrame(columns=["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page_Number", "Magazine_Category_id","Request Number"])
-    
-    end = counter()
-    # print(f"Taking {end - start} sec to process {total_pages} pages using parallel processing")
-    
+        df = pd.DataFrame(columns=RESULT_COLUMNS)
+
+    print_filter_summary(counters_before, get_metrics().counters())
+    print_text_layer_summary(counters_before, get_metrics().counters())
+    print_cache_summary(cache_before, cache.stats())
+
     return df
 
 # Version with progress bar
-def extract_with_progress(pdf_path: str, output_folder: str) -> pd.DataFrame:
+def extract_with_progress(pdf_path: str, output_folder: str, chunk_size: int = None,
+                          resume: bool = False, sink: "RowSink" = None,
+                          executor: ProcessPoolExecutor = None, cancel=None) -> "pd.DataFrame":
     """
     Version of extract() with progress monitoring
     """
     from tqdm import tqdm
-    
+
     # Get total pages
     with fitz.open(pdf_path) as doc:
         total_pages = len(doc)
-    
-    # Prepare arguments
-    page_args = [
-        (pdf_path, page_num, output_folder)
-        for page_num in range(total_pages)
-    ]
-    
-    results = []
+
     with tqdm(total=total_pages, desc="Processing PDF") as pbar:
-        with ProcessPoolExecutor(max_workers=max(1, multiprocessing.cpu_count() - 1)) as executor:
-            futures = []
-            
-            # Submit all jobs
-            for args in page_args:
-                future = executor.submit(process_single_page, args)
-                futures.append(future)
-            
-            # Collect results as they complete
-            for future in futures:
-                try:
-                    page_results = future.result()
-                    results.extend(page_results)
-                    pbar.update(1)
-                except Exception as e:
-                    print(f"Error processing page: {e}")
-                    pbar.update(1)
-    
-    return pd.DataFrame(results, 
-                       columns=["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page_Number", "Magazine_Category_id","Request Number"])
+        def update(done, total):
+            pbar.update(done - pbar.n)
+
+        return extract(pdf_path, output_folder, chunk_size, progress=update, resume=resume, sink=sink,
+                       executor=executor, cancel=cancel)
 
 # Optional: Add error handling wrapper
 import traceback
 
-def safe_extract(pdf_path: str, output_folder: str, with_progress: bool = True) -> pd.DataFrame:
+def safe_extract(pdf_path: str, output_folder: str, with_progress: bool = True,
+                 use_async: bool = False, resume: bool = False, sink: "RowSink" = None,
+                 executor: ProcessPoolExecutor = None, progress=None, cancel=None) -> "pd.DataFrame":
     """
     Wrapper function with detailed error logging
+
+    Args:
+        pdf_path: Path to PDF file
+        output_folder: Output folder for any necessary files
+        with_progress: Show a tqdm progress bar, unless `progress` is given
+        use_async: Parse pages in worker processes and send OCR requests
+            concurrently from one event loop (see src.async_ocr)
+        resume: Continue an interrupted run of the same PDF from its journal
+        sink: Optional writer the rows are streamed to as pages complete
+        executor: Optional worker pool shared across PDFs (see `extract`)
+        progress: Optional callback progress(done_pages, total_pages)
+        cancel: Optional threading.Event that stops the run early, keeping
+            the pages finished so far
     """
     try:
-        if with_progress:
-            return extract_with_progress(pdf_path, output_folder)
-        return extract(pdf_path, output_folder)
+        if use_async:
+            from src.async_ocr import extract_async
+            return extract_async(pdf_path, output_folder, resume=resume, sink=sink, executor=executor,
+                                 progress=progress, cancel=cancel)
+        if with_progress and progress is None:
+            return extract_with_progress(pdf_path, output_folder, resume=resume, sink=sink, executor=executor,
+                                         cancel=cancel)
+        return extract(pdf_path, output_folder, progress=progress, resume=resume, sink=sink, executor=executor,
+                       cancel=cancel)
     except Exception as e:
         # Log detailed traceback
         print(f"Error processing PDF: {e}")
         traceback.print_exc()
         
         # Return an empty DataFrame with the correct structure
-        return pd.DataFrame(columns=["Magazine_Arabic_Name", "Magazine_English_Name", "Magazine_Page_Number", "Magazine_Category_id","Request Number"])
+        import pandas as pd
+        return pd.DataFrame(columns=RESULT_COLUMNS)
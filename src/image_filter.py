@@ -0,0 +1,72 @@
+import os
+
+# Thresholds for skipping decorative images (separators, backgrounds, icons);
+# each one can be overridden from the .env file (IMAGE_MIN_SIDE,
+# IMAGE_MIN_BYTES, IMAGE_MAX_ASPECT), and 0 disables the check
+IMAGE_MIN_SIDE = 24  # Pixels; smaller images are bullets and icons
+IMAGE_MIN_BYTES = 256  # Encoded size; smaller ones are flat fills and spacers
+IMAGE_MAX_ASPECT = 15.0  # Longer side / shorter side; rules and borders are thinner
+
+
+class ImageFilter:
+    """
+    Decides which of a page's images are worth sending to OCR. The size and
+    shape checks use the image's dictionary only, so skipped images are
+    never extracted; the byte check runs on the extracted image.
+
+    Skips are counted in the run metrics (see `print_filter_summary`).
+    """
+
+    def __init__(self, min_side: int = None, min_bytes: int = None, max_aspect: float = None):
+        self.min_side = int(os.getenv("IMAGE_MIN_SIDE", IMAGE_MIN_SIDE)) if min_side is None else min_side
+        self.min_bytes = int(os.getenv("IMAGE_MIN_BYTES", IMAGE_MIN_BYTES)) if min_bytes is None else min_bytes
+        self.max_aspect = (float(os.getenv("IMAGE_MAX_ASPECT", IMAGE_MAX_ASPECT))
+                           if max_aspect is None else max_aspect)
+
+    def keep_xrefs(self, image_list, metrics) -> list:
+        """
+        Filter the entries of `page.get_images()` (xref, smask, width,
+        height, ...) on their size and shape.
+
+        Returns:
+            The xrefs to read
+        """
+        xrefs = []
+        for xref, _, width, height, *_ in image_list:
+            metrics.count("images_seen")
+            if self.min_side and min(width, height) < self.min_side:
+                metrics.count("images_skipped_small")
+            elif self.max_aspect and max(width, height) > self.max_aspect * max(1, min(width, height)):
+                metrics.count("images_skipped_aspect")
+            else:
+                xrefs.append(xref)
+        return xrefs
+
+    def keep_bytes(self, image: bytes, metrics) -> bool:
+        """False (and counted) for an extracted image below the byte threshold."""
+        if self.min_bytes and len(image) < self.min_bytes:
+            metrics.count("images_skipped_bytes")
+            return False
+        return True
+
+
+_filter = None
+
+
+def get_filter() -> ImageFilter:
+    global _filter
+    if _filter is None:
+        _filter = ImageFilter()
+    return _filter
+
+
+def print_filter_summary(before: dict, after: dict):
+    """Print what the image filter skipped during one run, from two metrics counter snapshots."""
+    delta = {name: after[name] - before[name] for name in after}
+    skipped = delta['images_skipped_small'] + delta['images_skipped_aspect'] + delta['images_skipped_bytes']
+    if not delta['images_seen']:
+        return
+    print(f"Image filter: {delta['images_seen']} images, {skipped} skipped "
+          f"({delta['images_skipped_small']} too small, {delta['images_skipped_aspect']} too thin, "
+          f"{delta['images_skipped_bytes']} too few bytes), "
+          f"{delta['xref_repeats']} repeated xrefs read once")
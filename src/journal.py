@@ -0,0 +1,89 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import List, Tuple
+
+# Journal file name inside the output folder; the full path can be
+# overridden from the .env file (OCR_JOURNAL_PATH)
+JOURNAL_NAME = "ocr_journal.db"
+
+
+class Journal:
+    """
+    Durable per-page record of an extraction job, so an interrupted run can
+    resume where it stopped.
+
+    A job is one PDF (identified by its content hash) read with one model.
+    Each page is committed in its own transaction as soon as all its images
+    are answered, with synchronous=FULL so a committed page also survives a
+    power loss. A page whose OCR failed for some image is stored as
+    incomplete: its rows still count, but a resumed run processes it again.
+    """
+
+    def __init__(self, pdf_path: str, output_folder: str = None, path: str = None):
+        self.path = path or os.getenv("OCR_JOURNAL_PATH") or os.path.join(output_folder or ".", JOURNAL_NAME)
+        with open(pdf_path, 'rb') as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        self.job = f"{os.getenv('MODEL_NAME') or ''}:{digest}"
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " job TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " category TEXT,"
+            " request_number TEXT,"
+            " complete INTEGER NOT NULL,"
+            " finished REAL NOT NULL,"
+            " PRIMARY KEY (job, page))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS page_rows ("
+            " job TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " arabic TEXT,"
+            " english TEXT,"
+            " PRIMARY KEY (job, page, position))"
+        )
+
+    def done_pages(self) -> set:
+        """Pages (0-based) finished with every image answered."""
+        rows = self.conn.execute("SELECT page FROM pages WHERE job = ? AND complete = 1", (self.job,))
+        return {page for page, in rows}
+
+    def record_page(self, page_number: int, category: str, request_number: str,
+                    names: List[Tuple[str, str]], complete: bool = True):
+        """Store one page's (arabic, english) names, replacing any earlier record of it."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM page_rows WHERE job = ? AND page = ?", (self.job, page_number))
+            self.conn.executemany(
+                "INSERT INTO page_rows VALUES (?, ?, ?, ?, ?)",
+                [(self.job, page_number, position, ara, eng) for position, (ara, eng) in enumerate(names)],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (self.job, page_number, category, request_number, int(complete), time.time()),
+            )
+
+    def results(self, complete_only: bool = False) -> list:
+        """All recorded rows as (arabic, english, page, category, request_number), in page order."""
+        return self.conn.execute(
+            "SELECT r.arabic, r.english, p.page + 1, p.category, p.request_number"
+            " FROM pages p JOIN page_rows r ON r.job = p.job AND r.page = p.page"
+            " WHERE p.job = ? AND p.complete >= ? ORDER BY p.page, r.position",
+            (self.job, int(complete_only)),
+        ).fetchall()
+
+    def reset(self):
+        """Forget this job, to start it over."""
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM page_rows WHERE job = ?", (self.job,))
+            self.conn.execute("DELETE FROM pages WHERE job = ?", (self.job,))
+
+    def close(self):
+        self.conn.close()
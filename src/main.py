@@ -1,14 +1,119 @@
-from src.extracting_images import safe_extract
-from src.similar_names import find_similar_names
-import pandas as pd
+from src.extracting_images import safe_extract, RESULT_COLUMNS
+from src.similar_names import iter_similar_names, SIMILAR_COLUMNS
+from src.registry import load_registry
+from src.output_sink import open_sink
+from src.metrics import get_metrics
+from src.ocr_cache import get_cache
+from src.pdf_worker import init_worker
+from src.rate_limiter import RateLimiter
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 from time import perf_counter as counter
 
 
-def flow(pdf_path,excel_path,output_path,sim_cat=False,threshold=100):
-    df = safe_extract(pdf_path=pdf_path,
-             output_folder=output_path)
-    df2 = pd.read_excel(excel_path)
+def _process_pdf(pdf_path,registry,index,output_path,sim_cat,threshold,use_async,resume,output_format,
+                 executor=None,combined=None,progress=None,cancel=None):
+    """
+    Extract one PDF and match it against the loaded registry; returns (ocr
+    rows, match rows). Where the time went is written to run_report.json
+    next to the outputs (see src.metrics).
+    """
+    metrics = get_metrics()
+    cache_before = get_cache().stats()
+    # OCR rows are streamed to ocr_results.<format> as pages complete
+    with open_sink(f"{output_path}/ocr_results", RESULT_COLUMNS, output_format) as ocr_sink, \
+            metrics.timer("ocr_extract"):
+        df = safe_extract(pdf_path=pdf_path,
+                 output_folder=output_path,
+                 use_async=use_async,
+                 resume=resume,
+                 sink=ocr_sink,
+                 executor=executor,
+                 progress=progress,
+                 cancel=cancel)
+    cache_after = get_cache().stats()
+    metrics.count("cache_hits", cache_after['hits'] - cache_before['hits'])
+    metrics.count("cache_misses", cache_after['misses'] - cache_before['misses'])
+    if combined is not None:
+        combined[0].write((os.path.basename(pdf_path),) + row for row in df.itertuples(index=False, name=None))
 
-    similer_names = find_similar_names(excel=df2,ocr_df=df,sim_cat=sim_cat,threshold=threshold)
+    # Matches are written a chunk at a time, led by the OCR row index as to_excel did
+    columns = [''] + list(df.columns) + SIMILAR_COLUMNS
+    with open_sink(f"{output_path}/similer", columns, output_format) as sink:
+        matches = iter_similar_names(excel=registry,ocr_df=df,sim_cat=sim_cat,threshold=threshold,index=index)
+        for similer_names in metrics.timed(matches, "similar_names"):
+            with metrics.timer("output_write"):
+                sink.write_frame(similer_names, index=True)
+                if combined is not None:
+                    combined[1].write((os.path.basename(pdf_path),) + row
+                                      for row in similer_names.itertuples(index=True, name=None))
 
-    similer_names.to_excel(f"{output_path}/similer.xlsx")
+    metrics.write_report(f"{output_path}/run_report.json",
+                         pdf=os.path.abspath(pdf_path),
+                         ocr_rows=len(df),
+                         pages_with_names=int(df['Magazine_Page_Number'].nunique()),
+                         match_rows=sink.rows_written,
+                         cancelled=cancel is not None and cancel.is_set())
+    return len(df), sink.rows_written
+
+
+def flow(pdf_path,excel_path,output_path,sim_cat=False,threshold=100,use_async=False,resume=False,
+         output_format=None,progress=None,cancel=None):
+    # progress(done_pages, total_pages) is called as pages finish; setting the
+    # `cancel` event stops the OCR and matches the names read so far
+    get_metrics().reset()
+    with get_metrics().timer("registry_load"):
+        df2, index = load_registry(excel_path, sim_cat=sim_cat, threshold=threshold)
+    _process_pdf(pdf_path, df2, index, output_path, sim_cat, threshold, use_async, resume, output_format,
+                 progress=progress, cancel=cancel)
+
+
+def batch_flow(pdf_paths,excel_path,output_path,sim_cat=False,threshold=100,use_async=False,resume=False,
+               output_format=None):
+    """
+    Run `flow` over many PDFs with one registry load and one worker pool.
+
+    The pool starts once and opens each PDF as its tasks arrive, and its
+    rate limiter spans the whole batch. Every PDF gets its own folder in
+    `output_path` (named after the file, with its own journal, so `resume`
+    works per file, and its own run_report.json); combined_ocr_results and
+    combined_similer hold the rows of all of them, led by a PDF_File column.
+
+    Returns:
+        List of (pdf_path, ocr rows, match rows, seconds), None counts for a
+        PDF that failed
+    """
+    start = counter()
+    df2, index = load_registry(excel_path, sim_cat=sim_cat, threshold=threshold)
+    print(f"Registry loaded in {counter() - start:.1f}s")
+
+    summary = []
+    folders = set()
+    max_workers = max(1, multiprocessing.cpu_count() - 1)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(None, RateLimiter(), get_metrics())) as executor, \
+            open_sink(f"{output_path}/combined_ocr_results", ['PDF_File'] + RESULT_COLUMNS,
+                      output_format) as combined_ocr, \
+            open_sink(f"{output_path}/combined_similer", ['PDF_File', ''] + RESULT_COLUMNS + SIMILAR_COLUMNS,
+                      output_format) as combined_similer:
+        for number, pdf_path in enumerate(pdf_paths, 1):
+            print(f"[{number}/{len(pdf_paths)}] {pdf_path}")
+            name = os.path.splitext(os.path.basename(pdf_path))[0]
+            if name in folders:  # Same file name from another directory
+                name = f"{name}_{number}"
+            folders.add(name)
+            pdf_output = os.path.join(output_path, name)
+            os.makedirs(pdf_output, exist_ok=True)
+            pdf_start = counter()
+            get_metrics().reset()  # Each PDF gets its own run_report.json
+            try:
+                rows, matches = _process_pdf(pdf_path, df2, index, pdf_output, sim_cat, threshold, use_async,
+                                             resume, output_format, executor=executor,
+                                             combined=(combined_ocr, combined_similer))
+            except Exception as e:
+                print(f"Error processing {pdf_path}: {e}")
+                rows = matches = None
+            summary.append((pdf_path, rows, matches, counter() - pdf_start))
+    print(f"Processed {len(pdf_paths)} PDFs in {counter() - start:.1f}s")
+    return summary
@@ -0,0 +1,198 @@
+import bisect
+import json
+import multiprocessing
+import time
+from contextlib import contextmanager
+from time import perf_counter as counter
+
+# Timed stages; each keeps a call count, total and maximum seconds
+STAGES = (
+    "registry_load",    # load_registry (snapshot or workbook)
+    "ocr_extract",      # safe_extract, end to end
+    "page_parse",       # page text, fields and image list
+    "image_extract",    # doc.extract_image
+    "image_encode",     # encode_image (decode, resize, JPEG, base64)
+    "ocr_request",      # one API call, as seen by the caller
+    "rate_limit_wait",  # sleeping for a slot of the shared budget
+    "similar_names",    # producing the matches
+    "output_write",     # writing the match rows
+)
+COUNTERS = (
+    "ocr_images",          # images sent, counting every attempt
+    "tokens",              # total_tokens reported by the API
+    "rate_limit_retries",  # requests refused with a 429 and sent again
+    "transient_retries",   # requests sent again after a connection error, timeout or 5xx
+    "ocr_errors",          # requests that failed for another reason
+    "cache_hits",
+    "cache_misses",
+    "images_seen",            # image occurrences on the pages read
+    "images_skipped_small",   # skipped by src.image_filter
+    "images_skipped_aspect",
+    "images_skipped_bytes",
+    "xref_repeats",           # occurrences answered from the per-xref memo
+    "images_text_resolved",   # named from the page text, never sent to OCR
+    "ocr_parse_failures",     # images a reply left unanswered or malformed; only these are re-sent
+    "encoded_images",         # payloads built by encode_image
+    "payload_bytes",          # their base64 size
+    "estimated_image_tokens", # their vision tokens, by image size
+)
+# Upper bounds of the OCR latency histogram buckets: 0.1 s to about 290 s,
+# each bucket sqrt(2) wider than the last; slower requests fall in a last one
+LATENCY_BUCKETS = tuple(round(0.1 * 2 ** (i / 2), 3) for i in range(24))
+HISTOGRAM_STAGE = "ocr_request"
+
+_STAGE_SLOTS = 3  # count, total, max
+_COUNTERS_AT = len(STAGES) * _STAGE_SLOTS
+_HISTOGRAM_AT = _COUNTERS_AT + len(COUNTERS)
+_SIZE = _HISTOGRAM_AT + len(LATENCY_BUCKETS) + 1
+
+
+class Metrics:
+    """
+    Run metrics shared by every worker process of a pool.
+
+    Like the RateLimiter, the values live in shared memory guarded by a
+    multiprocessing lock, so timings taken in the workers add up with the
+    ones of the main process. Pass the object to the workers through the
+    pool initializer (see `set_metrics`).
+    """
+
+    def __init__(self):
+        self._lock = multiprocessing.Lock()
+        self._values = multiprocessing.RawArray('d', _SIZE)
+        self.started = time.time()
+
+    def reset(self):
+        """Start a new run."""
+        with self._lock:
+            for i in range(_SIZE):
+                self._values[i] = 0.0
+        self.started = time.time()
+
+    def add_time(self, stage: str, seconds: float):
+        at = STAGES.index(stage) * _STAGE_SLOTS
+        with self._lock:
+            values = self._values
+            values[at] += 1
+            values[at + 1] += seconds
+            values[at + 2] = max(values[at + 2], seconds)
+            if stage == HISTOGRAM_STAGE:
+                values[_HISTOGRAM_AT + bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as one call of `stage`."""
+        start = counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, counter() - start)
+
+    def timed(self, iterable, stage: str):
+        """Iterate `iterable`, charging the time spent producing its items to `stage` as one call."""
+        spent = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    spent += counter() - start
+                yield item
+        finally:
+            self.add_time(stage, spent)
+
+    def count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._values[_COUNTERS_AT + COUNTERS.index(name)] += amount
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {name: int(self._values[_COUNTERS_AT + i]) for i, name in enumerate(COUNTERS)}
+
+    def percentile(self, q: float, histogram=None) -> float:
+        """
+        Estimate the q-th percentile (0-100) of the OCR request latency from
+        the histogram, interpolating inside the bucket it falls in.
+        """
+        histogram = histogram or list(self._values[_HISTOGRAM_AT:])
+        total = sum(histogram)
+        if not total:
+            return None
+        rank = q / 100 * total
+        seen = 0.0
+        for i, in_bucket in enumerate(histogram):
+            if in_bucket and seen + in_bucket >= rank:
+                low = LATENCY_BUCKETS[i - 1] if i else 0.0
+                if i < len(LATENCY_BUCKETS):
+                    high = LATENCY_BUCKETS[i]
+                else:  # Open-ended last bucket: up to the slowest request
+                    high = self._values[STAGES.index(HISTOGRAM_STAGE) * _STAGE_SLOTS + 2]
+                return round(low + (high - low) * (rank - seen) / in_bucket, 3)
+            seen += in_bucket
+        return None
+
+    def _stage(self, stage: str) -> dict:
+        at = STAGES.index(stage) * _STAGE_SLOTS
+        calls, total, longest = self._values[at:at + _STAGE_SLOTS]
+        return {
+            "calls": int(calls),
+            "total_seconds": round(total, 3),
+            "mean_seconds": round(total / calls, 4) if calls else None,
+            "max_seconds": round(longest, 3),
+        }
+
+    def snapshot(self) -> dict:
+        """The run so far as a JSON-ready dict."""
+        with self._lock:
+            histogram = list(self._values[_HISTOGRAM_AT:])
+            stages = {stage: self._stage(stage) for stage in STAGES}
+        counters = self.counters()
+        lookups = counters["cache_hits"] + counters["cache_misses"]
+
+        def per(total, count):
+            return round(total / count, 1) if count else None
+
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["inf"]
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": counters,
+            "cache_hit_rate": round(counters["cache_hits"] / lookups, 4) if lookups else None,
+            "per_image": {
+                "payload_bytes": per(counters["payload_bytes"], counters["encoded_images"]),
+                "estimated_image_tokens": per(counters["estimated_image_tokens"], counters["encoded_images"]),
+                "tokens": per(counters["tokens"], counters["ocr_images"]),  # as billed, prompt included
+            },
+            "ocr_latency": {
+                "percentiles": {f"p{q}": self.percentile(q, histogram) for q in (50, 90, 95, 99)},
+                # Requests per bucket, keyed by the bucket's upper bound in seconds
+                "histogram": {bound: int(n) for bound, n in zip(bounds, histogram) if n},
+            },
+        }
+
+    def write_report(self, path: str, **info):
+        """Write the snapshot, led by `info` (file names, row counts...), as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**info, **self.snapshot()}, f, indent=2, ensure_ascii=False)
+
+
+_metrics = None
+
+
+def set_metrics(metrics: Metrics):
+    """Install the pool's shared metrics in this process (use from the pool initializer)."""
+    global _metrics
+    _metrics = metrics
+
+
+def get_metrics() -> Metrics:
+    """Return the shared metrics, or process-local ones when no pool installed them."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
@@ -0,0 +1,161 @@
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz as rapid_fuzz, process
+
+# Gram size per script: Arabic names are short and its alphabet is larger,
+# so bigrams are already selective; Latin names need trigrams
+ARABIC_GRAM = 2
+LATIN_GRAM = 3
+
+_ARABIC = re.compile('[\u0600-\u06ff\u0750-\u077f\u08a0-\u08ff\ufb50-\ufdff\ufe70-\ufeff]')
+
+
+def normalize_category(code):
+    """
+    Canonical category code, so registry and page codes compare equal:
+    35, 35.0, '35', '035' and '٣٥' all become '35'. Missing codes become None.
+    """
+    if code is None or (not isinstance(code, str) and pd.isna(code)):
+        return None
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    text = str(code).strip()
+    try:
+        return str(int(text))
+    except ValueError:
+        return text or None
+
+
+def _grams(text: str, q: int) -> Counter:
+    return Counter(text[i:i + q] for i in range(len(text) - q + 1))
+
+
+class _GramTable:
+    """Inverted index from q-gram to (row, occurrences) for the names of one script."""
+
+    def __init__(self, q: int, rows: List[int], choices: List[str]):
+        self.q = q
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.lengths = np.array([len(choices[row]) for row in rows], dtype=np.int64)
+        gram_ids = {}
+        postings = ([], [], [])  # gram id, local row, occurrences
+        for local, row in enumerate(rows):
+            for gram, count in _grams(choices[row], q).items():
+                postings[0].append(gram_ids.setdefault(gram, len(gram_ids)))
+                postings[1].append(local)
+                postings[2].append(min(count, 255))
+        grams = np.array(postings[0], dtype=np.int64)
+        order = np.argsort(grams, kind='stable')
+        self.gram_ids = gram_ids
+        self.posting_rows = np.array(postings[1], dtype=np.int32)[order]
+        self.posting_counts = np.array(postings[2], dtype=np.uint8)[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(grams, minlength=len(gram_ids)))))
+        # Rows sorted by length, with the start of each length's run
+        self.by_length = np.argsort(self.lengths, kind='stable')
+        self.length_starts = np.searchsorted(self.lengths[self.by_length],
+                                             np.arange(self.lengths.max(initial=0) + 2))
+
+    def candidates(self, query: str, min_score: float) -> np.ndarray:
+        """Rows whose shared grams with `query` allow a ratio of at least `min_score`."""
+        q = self.q
+
+        # ratio = 200 * LCS / total length, so the LCS must be at least
+        # `common`. Every deleted or inserted character breaks at most q - 1
+        # of the q-grams of the common subsequence, which bounds the number
+        # of grams the two names still share. Both only depend on the length
+        # of the registry name.
+        lengths = np.arange(len(self.length_starts) - 1)
+        total = lengths + len(query)
+        common = np.ceil(min_score * total / 200 - 1e-9)
+        needed = common - q + 1 - (q - 1) * (total - 2 * common)
+        possible = common <= np.minimum(lengths, len(query))
+
+        # Lengths where even a name sharing no gram may match
+        found = [self.by_length[self.length_starts[length]:self.length_starts[length + 1]]
+                 for length in np.flatnonzero(possible & (needed <= 0))]
+
+        rows, counts = [], []
+        for gram, count in _grams(query, q).items():
+            gram_id = self.gram_ids.get(gram)
+            if gram_id is not None:
+                start, end = self.offsets[gram_id], self.offsets[gram_id + 1]
+                rows.append(self.posting_rows[start:end])
+                counts.append(np.minimum(self.posting_counts[start:end], count))
+        if rows:
+            shared = np.bincount(np.concatenate(rows), np.concatenate(counts), minlength=len(self.rows))
+            touched = np.flatnonzero(shared)
+            length = self.lengths[touched]
+            found.append(touched[possible[length] & (needed[length] > 0) & (shared[touched] >= needed[length])])
+        if not found:
+            return self.rows[:0]
+        return self.rows[np.concatenate(found)]
+
+
+class NameIndex:
+    """
+    Candidate index over preprocessed registry names for token_sort_ratio.
+
+    Names are split by script into an Arabic and a Latin gram table. A query
+    is looked up in both, each with its own gram size, and only names that
+    share enough grams for the threshold to be reachable are scored. The
+    filter never drops a name that would reach the threshold. Build it once
+    per registry and reuse it for every query.
+    """
+
+    def __init__(self, choices: List[str]):
+        self.choices = np.array(choices, dtype=object)
+        arabic = [row for row, choice in enumerate(choices) if choice and _ARABIC.search(choice)]
+        is_arabic = set(arabic)
+        latin = [row for row, choice in enumerate(choices) if choice and row not in is_arabic]
+        self.tables = [_GramTable(ARABIC_GRAM, arabic, choices), _GramTable(LATIN_GRAM, latin, choices)]
+
+    def __len__(self):
+        return len(self.choices)
+
+    def candidates(self, query: str, threshold: float) -> np.ndarray:
+        """Sorted row ids that may score at least `threshold` (rounded) against `query`."""
+        if not query:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([table.candidates(query, threshold - 0.5) for table in self.tables]))
+
+    def match(self, query: str, threshold: float) -> np.ndarray:
+        """
+        Sorted row ids whose ratio with `query`, rounded like fuzzywuzzy,
+        is at least `threshold`. Requires `threshold` > 0.5: below that even
+        empty names match, which an index cannot answer.
+        """
+        rows = self.candidates(query, threshold)
+        if not len(rows):
+            return rows
+        scores = process.cdist([query], self.choices[rows].tolist(), scorer=rapid_fuzz.ratio,
+                               processor=None, score_cutoff=threshold - 0.5, dtype=np.float32)[0]
+        return rows[np.rint(scores) >= threshold]
+
+
+class CategoryPartitions:
+    """
+    Registry names grouped by normalized category code, for `sim_cat` matching.
+
+    Each category keeps the global row ids and preprocessed names of its rows
+    as contiguous arrays, and optionally its own NameIndex, so a query is
+    only scored against the names of its category. Rows without a category
+    are left out: they never match.
+    """
+
+    def __init__(self, choices: List[str], categories, indexed: bool = True):
+        self.size = len(choices)
+        groups = {}
+        for row, category in enumerate(categories):
+            code = normalize_category(category)
+            if code is not None:
+                groups.setdefault(code, []).append(row)
+        self.rows = {code: np.array(rows, dtype=np.int64) for code, rows in groups.items()}
+        self.choices = {code: [choices[row] for row in rows] for code, rows in groups.items()}
+        self.indexes = {code: NameIndex(names) for code, names in self.choices.items()} if indexed else None
+
+    def __len__(self):
+        return self.size
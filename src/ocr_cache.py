@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# Defaults for the cache location and eviction policy; each one can be
+# overridden from the .env file (OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES,
+# OCR_CACHE_MAX_AGE_DAYS). Without OCR_CACHE_PATH the cache lives in the
+# user's cache folder (see `default_cache_path`), wherever the app starts from
+CACHE_NAME = "ocr_cache.db"
+CACHE_DIR_NAME = "ocr_app"
+CACHE_MAX_ENTRIES = 200000
+CACHE_MAX_AGE_DAYS = 180
+
+
+class OCRCache:
+    """
+    Content-addressed on-disk cache of OCR results.
+
+    Entries are keyed by a hash of the raw image bytes plus the model name, so
+    the same logo extracted from any page of any magazine is only sent to the
+    API once per model. The database is opened in WAL mode, which lets every
+    worker process read and write the same file concurrently.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, max_age_days: float = None):
+        self.path = path or os.getenv("OCR_CACHE_PATH") or default_cache_path()
+        self.max_entries = max_entries or int(os.getenv("OCR_CACHE_MAX_ENTRIES", CACHE_MAX_ENTRIES))
+        max_age_days = max_age_days or float(os.getenv("OCR_CACHE_MAX_AGE_DAYS", CACHE_MAX_AGE_DAYS))
+        self.max_age = max_age_days * 24 * 3600
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " result TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results(last_used)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    @staticmethod
+    def key(image_bytes: bytes, model: str) -> str:
+        """Build the cache key for an image and the model that reads it."""
+        digest = hashlib.sha256()
+        digest.update((model or "").encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_bytes)
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return the cached OCR dict for `key`, or None on a miss."""
+        row = self.conn.execute("SELECT result, created FROM ocr_results WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.max_age:
+            self._count("misses")
+            return None
+        self.conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict, model: str = None):
+        """Store an OCR dict (including empty ones for unreadable logos)."""
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ocr_results VALUES (?, ?, ?, ?, ?)",
+            (key, model, json.dumps(result, ensure_ascii=False), now, now),
+        )
+
+    def evict(self) -> int:
+        """
+        Apply the eviction policy: drop entries older than the maximum age,
+        then the least recently used ones above the maximum entry count.
+
+        Returns:
+            Number of removed entries
+        """
+        removed = self.conn.execute(
+            "DELETE FROM ocr_results WHERE created < ?", (time.time() - self.max_age,)
+        ).rowcount
+        removed += self.conn.execute(
+            "DELETE FROM ocr_results WHERE key IN ("
+            " SELECT key FROM ocr_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        return removed
+
+    def clear(self):
+        """Drop every entry, e.g. to time a run against a cold cache."""
+        self.conn.execute("DELETE FROM ocr_results")
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters shared by all processes and the entry count."""
+        stats = dict(self.conn.execute("SELECT name, value FROM counters").fetchall())
+        stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM ocr_results").fetchone()[0]
+        return stats
+
+    def _count(self, name: str):
+        self.conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def close(self):
+        self.conn.close()
+
+
+class NullCache:
+    """Stand-in for an OCRCache that could not be opened: remembers nothing, so every image is sent."""
+
+    path = None
+    key = staticmethod(OCRCache.key)
+
+    def get(self, key: str):
+        return None
+
+    def put(self, key: str, result: dict, model: str = None):
+        pass
+
+    def evict(self) -> int:
+        return 0
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"hits": 0, "misses": 0, "entries": 0}
+
+    def close(self):
+        pass
+
+
+def default_cache_path() -> str:
+    """
+    The cache file in the user's cache folder: %LOCALAPPDATA% on Windows,
+    $XDG_CACHE_HOME or ~/.cache elsewhere. The folder is created if needed.
+    """
+    if sys.platform == "win32":
+        base = os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), "AppData", "Local")
+    else:
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    folder = os.path.join(base, CACHE_DIR_NAME)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, CACHE_NAME)
+
+
+_cache = None
+_cache_pid = None
+
+
+def get_cache():
+    """
+    Return this process's cache handle. SQLite connections must not cross a
+    fork, so each worker process lazily opens its own connection. A cache
+    that cannot be opened is replaced by a NullCache: the run goes on
+    without it instead of failing.
+    """
+    global _cache, _cache_pid
+    if _cache is None or _cache_pid != os.getpid():
+        try:
+            _cache = OCRCache()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: OCR cache unavailable ({e}); running without it")
+            _cache = NullCache()
+        _cache_pid = os.getpid()
+    return _cache
@@ -1,37 +1,206 @@
 import base64
-from openai import OpenAI
 from dotenv import load_dotenv
 import cv2
-import ast
+import numpy as np
 import os
 
+from src.metrics import get_metrics
+from src.parser_response import parse_reply, parse_batch_reply, ReplyError, BRAND_SCHEMA, BATCH_SCHEMA
 
 load_dotenv()
 
-client = OpenAI()
+# Built on first use (see get_client): importing openai takes most of a
+# second, which the GUI and the page-parsing workers do not need to pay
+client = None
+
+# Batch mode: pack several images into one request. Each value can be
+# overridden from the .env file (OCR_BATCH_SIZE, OCR_BATCH_MAX_BYTES,
+# OCR_BATCH_RETRIES); a batch size of 1 sends one image per request.
+OCR_BATCH_SIZE = 1
+OCR_BATCH_MAX_BYTES = 4 * 1024 * 1024  # base64 payload of one request
+OCR_BATCH_RETRIES = 2  # extra rounds for images a reply did not cover or answered malformed
+
+# How the reply is constrained (overridable with OCR_RESPONSE_FORMAT):
+# "json_schema" for structured outputs, "json_object" for plain JSON mode, or
+# "text" for endpoints that support neither (the prompt asks for a python dict)
+OCR_RESPONSE_FORMAT = "json_schema"
+
+# Encoding policy: "adaptive", or "half" for the original fixed half-size
+# JPEG. Each value can be overridden from the .env file (ENCODE_POLICY,
+# ENCODE_MIN_SIDE, ENCODE_PIXEL_BUDGET, ENCODE_JPEG_QUALITY)
+ENCODE_POLICY = "adaptive"
+# Low-detail tile of the vision model: a flat 85 tokens with detail "low".
+# Fixed by the API, so not overridable
+ENCODE_TILE_SIDE = 512
+ENCODE_MIN_SIDE = 48  # shorter side below which logo text stops being legible
+ENCODE_PIXEL_BUDGET = 768 * 768  # cap for huge scans, whatever their shape
+ENCODE_JPEG_QUALITY = 80
+FLAT_LEVELS = 16  # a logo is flat when this many gray levels cover...
+FLAT_COVERAGE = 0.9  # ...this share of its pixels; it is then sent as PNG
+
+
+def crop_borders(gray, tolerance=12, margin=2):
+  """Cut the uniform margins: outer rows and columns within `tolerance` of the border color."""
+  border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+  content = np.abs(gray.astype(np.int16) - int(np.median(border))) > tolerance
+  rows = np.flatnonzero(content.any(axis=1))
+  if not rows.size:
+    return gray
+  cols = np.flatnonzero(content.any(axis=0))
+  return gray[max(0, rows[0] - margin):rows[-1] + margin + 1, max(0, cols[0] - margin):cols[-1] + margin + 1]
+
+
+def encode_scale(width, height):
+  """
+  Scale factor (at most 1) for the OCR payload: fit the low-detail tile,
+  unless that would take the shorter side below ENCODE_MIN_SIDE, and never
+  exceed the pixel budget.
+  """
+  min_side = int(os.getenv("ENCODE_MIN_SIDE", ENCODE_MIN_SIDE))
+  budget = int(os.getenv("ENCODE_PIXEL_BUDGET", ENCODE_PIXEL_BUDGET))
+  legible = max(ENCODE_TILE_SIDE / max(width, height), min_side / max(1, min(width, height)))
+  return min(1.0, legible, (budget / (width * height)) ** 0.5)
+
+
+def estimate_image_tokens(width, height):
+  """
+  Vision tokens of an image sent with the detail `image_detail` picks: a
+  flat 85 within the low-detail tile, else 85 plus 170 per 512px tile.
+  """
+  if max(width, height) <= ENCODE_TILE_SIDE:
+    return 85
+  scale = min(1.0, 2048 / max(width, height))
+  scale *= min(1.0, 768 / (min(width, height) * scale))
+  return 85 + 170 * int(np.ceil(width * scale / 512) * np.ceil(height * scale / 512))
+
+
+def is_flat(gray):
+  """Few gray levels (drawn logos, text) rather than a photo or a scan."""
+  counts = np.bincount(gray.ravel(), minlength=256)
+  return np.sort(counts)[-FLAT_LEVELS:].sum() >= FLAT_COVERAGE * gray.size
+
 
 # Function to encode the image
-def encode_image(image_path):
-  img = cv2.imread(image_path)
-  gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-  gray = cv2.resize(gray,None,fx=0.5,fy=0.5)
-  buffer = cv2.imencode('.jpg',gray)[1]
-  buffer_objects = buffer.tobytes()
+def encode_image(image):
+  """
+  Encode an image for the OCR request.
+
+  `image` may be the raw bytes of an encoded image (as returned by
+  `doc.extract_image`), an encoded NumPy buffer, an already decoded NumPy
+  image, or a file path. Raw bytes are decoded in place through a memoryview,
+  so nothing touches the filesystem.
+
+  The adaptive policy crops uniform borders, scales by `encode_scale` and
+  sends flat logos as PNG, everything else as JPEG. Payload bytes and the
+  estimated vision tokens are counted in the run metrics.
+  """
+  metrics = get_metrics()
+  with metrics.timer("image_encode"):
+    if isinstance(image, str):
+      gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    elif isinstance(image, np.ndarray) and image.ndim > 1:
+      gray = image if image.ndim == 2 else cv2.cvtColor(image,cv2.COLOR_BGR2GRAY)
+    else:
+      gray = cv2.imdecode(np.frombuffer(memoryview(image), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None or gray.size == 0:
+      raise ValueError("Could not decode image")
+    if os.getenv("ENCODE_POLICY", ENCODE_POLICY) == "half":
+      gray = cv2.resize(gray,None,fx=0.5,fy=0.5)
+      buffer = cv2.imencode('.jpg',gray)[1]
+    else:
+      gray = crop_borders(gray)
+      scale = encode_scale(gray.shape[1], gray.shape[0])
+      if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+      if is_flat(gray):
+        buffer = cv2.imencode('.png', gray, [cv2.IMWRITE_PNG_COMPRESSION, 5])[1]
+      else:
+        quality = int(os.getenv("ENCODE_JPEG_QUALITY", ENCODE_JPEG_QUALITY))
+        buffer = cv2.imencode('.jpg', gray, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+    buffer_objects = buffer.tobytes()
+
+    encoded = base64.b64encode(buffer_objects).decode('utf-8')
+  metrics.count("encoded_images")
+  metrics.count("payload_bytes", len(encoded))
+  metrics.count("estimated_image_tokens", estimate_image_tokens(gray.shape[1], gray.shape[0]))
+  return encoded
 
-  return base64.b64encode(buffer_objects).decode('utf-8')
 
+def data_url(base64_image):
+  """Data URL of an encoded image, typed from its signature (PNG or JPEG)."""
+  mime = "image/png" if base64_image.startswith("iVBOR") else "image/jpeg"
+  return f"data:{mime};base64,{base64_image}"
 
 
-def get_OCR(image_path):
+def payload_size(base64_image):
+  """(width, height) of an encoded image, read from its PNG or JPEG header; None if not found."""
+  data = base64.b64decode(base64_image)
+  if data.startswith(b'\x89PNG'):
+    return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+  i = 2  # JPEG: walk the segments up to the start-of-frame marker
+  while i + 9 <= len(data) and data[i] == 0xFF:
+    marker = data[i + 1]
+    if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+      return int.from_bytes(data[i + 7:i + 9], 'big'), int.from_bytes(data[i + 5:i + 7], 'big')
+    i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+  return None
 
-  base64_image = encode_image(image_path=image_path)
-  model = os.getenv("MODEL_NAME")
-  response = client.chat.completions.create(
-    model=model,
-    messages=[{"role":'system','content':"You are ocr agent taking an image and return the brand name only"},
+
+def image_detail(base64_image):
+  """
+  The `detail` to send an image with: "low" when it fits the low-detail
+  tile, which is then billed a flat 85 tokens (the default would bill it
+  as a high-detail tile, 255), else "auto".
+  """
+  size = payload_size(base64_image)
+  return "low" if size and max(size) <= ENCODE_TILE_SIDE else "auto"
+
+
+def image_part(base64_image):
+  """The image_url content part of an encoded image."""
+  return {"type": "image_url", "image_url": {"url": data_url(base64_image), "detail": image_detail(base64_image)}}
+
+
+
+def get_client():
+  """The OpenAI client, created on first use from the environment (.env included)."""
+  global client
+  if client is None:
+    from openai import OpenAI
+    # Retries are handled by the shared rate limiter, not by the client
+    client = OpenAI(max_retries=0)
+  return client
+
+
+def get_OCR(image):
+  return get_OCR_with_usage(image)[0]
+
+
+def response_format():
+  return os.getenv("OCR_RESPONSE_FORMAT", OCR_RESPONSE_FORMAT)
+
+
+def answer_instructions(batch=False):
+  """System messages describing the expected reply, for the configured response format."""
+  if response_format() == "text":
+    if batch:
+      return [{"role":"system",'content':"Your answer should be a python list only, with one dict per image in the same order as the images"},
+              {"role":"system",'content':"Each dict has the key IMAGE with the image number, EN for english name if exist and AR for Arabic name if exist"},
+              {"role":'system',"content":"If unable to recognize the brand of an image return a dict with the IMAGE key only"}]
+    return [{"role":"system",'content':"Your answer should be a python dict only with two keys EN for english name if exist AR for Arabic name if exist"},
+            {"role":'system',"content":"There is four cases Ar and EN names so create dict with EN and AR key, Ar name only create dict with AR key only, EN only create dict with EN key only if an able to recognize the brand return emty dict"}]
+  if batch:
+    return [{"role":"system",'content':"Your answer should be a JSON object only, with the key images holding one object per image in the same order as the images"},
+            {"role":"system",'content':"Each object has the key IMAGE with the image number, EN with the english name and AR with the Arabic name"},
+            {"role":'system',"content":"Use an empty string for a name that is not in the image, and for both if unable to recognize the brand"}]
+  return [{"role":"system",'content':"Your answer should be a JSON object only with two keys EN for the english name and AR for the Arabic name"},
+          {"role":'system',"content":"Use an empty string for a name that is not in the image, and for both if unable to recognize the brand"}]
+
+
+def build_messages(base64_image):
+  return [{"role":'system','content':"You are ocr agent taking an image and return the brand name only"},
               {"role":'system','content':"The brand could be in Arabic or English or both"},
-              {"role":"system",'content':"Your answer should be a python dict only with two keys EN for english name if exist AR for Arabic name if exist"},
-              {"role":'system',"content":"There is four cases Ar and EN names so create dict with EN and AR key, Ar name only create dict with AR key only, EN only create dict with EN key only if an able to recognize the brand return emty dict"},
+              *answer_instructions(),
 
       {
         "role": "user",
@@ -40,22 +209,147 @@ def get_OCR(image_path):
             "type": "text",
             "text": "What is in this brand?",
           },
-          {
-            "type": "image_url",
-            "image_url": {
-              "url":  f"data:image/jpeg;base64,{base64_image}"
-            },
-          },
+          image_part(base64_image),
         ],
       }
-    ],
-  )
+    ]
+
+
+def build_batch_messages(base64_images):
+  n = len(base64_images)
+  content = [{"type": "text", "text": f"There are {n} brand images numbered 1 to {n}. What is the brand in each one?"}]
+  for i, base64_image in enumerate(base64_images, 1):
+    content.append({"type": "text", "text": f"Image {i}:"})
+    content.append(image_part(base64_image))
+
+  return [{"role":'system','content':"You are ocr agent taking several images and return the brand name of each image only"},
+          {"role":'system','content':"The brand could be in Arabic or English or both"},
+          *answer_instructions(batch=True),
+          {"role": "user", "content": content}]
+
+
+def build_request(base64_images):
+  """
+  Keyword arguments of the chat-completions call for some encoded images.
+  A single image is sent with the one-image prompt.
+  """
+  batch = len(base64_images) > 1
+  request = {
+    "model": os.getenv("MODEL_NAME"),
+    "messages": build_batch_messages(base64_images) if batch else build_messages(base64_images[0]),
+  }
+  if response_format() == "json_schema":
+    request["response_format"] = {"type": "json_schema", "json_schema": BATCH_SCHEMA if batch else BRAND_SCHEMA}
+  elif response_format() == "json_object":
+    request["response_format"] = {"type": "json_object"}
+  return request
+
+
+def parse_OCR(response, count=1):
+  """
+  Map a reply back to its images (see src.parser_response).
+
+  Returns:
+    (answers, used_tokens): one dict per image, None for images the reply
+    did not cover or answered malformed. Those are counted as parse
+    failures in the run metrics, and the callers re-send only them (see
+    `ocr_in_batches` and src.async_ocr.ocr_worker)
+  """
+  used_tokens = response.usage.total_tokens if response.usage else 0
+  text = response.choices[0].message.content
+  # Only the legacy plain-text prompt asks for a python literal
+  literal = response_format() == "text"
+  try:
+    answers = parse_batch_reply(text, count, literal) if count > 1 else [parse_reply(text, literal)]
+  except ReplyError:
+    answers = [None] * count
+  failed = answers.count(None)
+  if failed:
+    get_metrics().count("ocr_parse_failures", failed)
+  return answers, used_tokens
+
+
+def get_OCR_with_usage(image):
+  """OCR one image; raises ReplyError when its reply cannot be parsed."""
+  answers, used_tokens = get_OCR_batch_with_usage([encode_image(image)])
+  if answers[0] is None:
+    raise ReplyError("malformed OCR reply")
+  return answers[0], used_tokens
+
+
+def get_OCR_batch_with_usage(base64_images):
+  """
+  OCR several encoded images in one request.
+
+  Returns:
+    (answers, used_tokens): one dict per image, None for images the reply
+    did not cover or answered malformed
+  """
+  response = get_client().chat.completions.create(**build_request(base64_images))
+  return parse_OCR(response, len(base64_images))
+
 
-  
-  d = response.choices[0].message.content.replace("```","").replace("python","").replace('json','')
-  d = ast.literal_eval(d)
+async def get_OCR_batch_async(async_client, base64_images):
+  """Same request as get_OCR_batch_with_usage, sent through an AsyncOpenAI client."""
+  response = await async_client.chat.completions.create(**build_request(base64_images))
+  return parse_OCR(response, len(base64_images))
 
-  return d
+
+def batch_limits():
+  """Return the configured (images per request, payload bytes per request)."""
+  return (max(1, int(os.getenv("OCR_BATCH_SIZE", OCR_BATCH_SIZE))),
+          int(os.getenv("OCR_BATCH_MAX_BYTES", OCR_BATCH_MAX_BYTES)))
+
+
+def pack_batches(sizes, batch_size, max_bytes):
+  """
+  Greedily pack payloads into batches of at most `batch_size` items and
+  `max_bytes` bytes (a payload larger than `max_bytes` goes alone).
+
+  Returns:
+    Lists of indices into `sizes`, in order
+  """
+  batches, batch, batch_bytes = [], [], 0
+  for i, size in enumerate(sizes):
+    if batch and (len(batch) == batch_size or batch_bytes + size > max_bytes):
+      batches.append(batch)
+      batch, batch_bytes = [], 0
+    batch.append(i)
+    batch_bytes += size
+  if batch:
+    batches.append(batch)
+  return batches
+
+
+def ocr_in_batches(payloads, send):
+  """
+  OCR encoded images in packed batches, re-sending only the images a reply
+  did not cover. The last retry round sends each remaining image alone.
+
+  Args:
+    payloads: {id: base64 image}
+    send: Function taking a list of base64 images and returning one dict
+      (or None) per image, e.g. a throttled get_OCR_batch_with_usage
+  Returns:
+    {id: ocr dict} for every image that was read
+  """
+  batch_size, max_bytes = batch_limits()
+  retries = int(os.getenv("OCR_BATCH_RETRIES", OCR_BATCH_RETRIES))
+  answers = {}
+  pending = list(payloads)
+  for round_ in range(retries + 1):
+    if not pending:
+      break
+    size = 1 if 0 < round_ == retries else batch_size
+    for batch in pack_batches([len(payloads[i]) for i in pending], size, max_bytes):
+      ids = [pending[j] for j in batch]
+      for i, answer in zip(ids, send([payloads[i] for i in ids])):
+        if answer is not None:
+          answers[i] = answer
+    pending = [i for i in pending if i not in answers]
+    if pending and round_ < retries:
+      print(f"OCR reply did not cover {len(pending)} images, retrying them")
+  return answers
 
 
 def get_names(d):
@@ -72,27 +366,3 @@ def get_names(d):
     if 'AR' not in d:
         aras+=""
   return engs , aras
-
-
-# start = counter()
-# pages,cats = extract('/home/ibrahim/Desktop/freelance/free.pdf')
-
-# aras, engs = [],[]
-# images_paths = os.listdir('/home/ibrahim/Desktop/freelance/Images')
-
-# for i,img in enumerate(images_paths):
-#     img_path = os.path.join('/home/ibrahim/Desktop/freelance/Images',img)
-#     d = get_OCR(img_path)
-#     eng , ara = get_names(d)
-#     aras.append(ara)
-#     engs.append(eng)
-#     os.remove(img_path)
-
-# end = counter()
-# print((pages),(cats),(aras),(engs))
-# df = pd.DataFrame({"Arabic":aras,"English":engs,'Page Number':pages,"Category":cats})
-
-# df.to_excel("names.xlsx")
-# print(f"OCR ends after {end - start} sec")
-# print(f"Total time take to OCR {len(images_paths)} Image is {end - start} sec")
-
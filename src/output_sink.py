@@ -0,0 +1,161 @@
+import csv
+import math
+import os
+
+import pandas as pd
+
+# Output file format: "xlsx", "csv" or "parquet"; can be overridden from the
+# .env file (OUTPUT_FORMAT, PARQUET_ROW_GROUP_ROWS)
+OUTPUT_FORMAT = "xlsx"
+PARQUET_ROW_GROUP_ROWS = 50000
+
+XLSX_MAX_ROWS = 1048576  # Excel's sheet limit, header included
+
+
+def _clean(value):
+    """Missing values (None, NaN, pd.NA) become empty cells."""
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+class RowSink:
+    """
+    Writes rows to an output file as they are produced, so a run never holds
+    its whole output in memory. Use as a context manager.
+    """
+
+    def __init__(self, path: str, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.rows_written = 0
+
+    def write(self, rows):
+        """Append row tuples, in `columns` order."""
+        rows = [[_clean(value) for value in row] for row in rows]
+        if rows:
+            self._write(rows)
+            self.rows_written += len(rows)
+
+    def write_frame(self, frame: pd.DataFrame, index: bool = False):
+        """Append a DataFrame's rows, its index first when `index` is set."""
+        self.write(frame.itertuples(index=index, name=None))
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink(RowSink):
+    """Flushed after every write, so the file can be read while the run continues."""
+
+    def __init__(self, path: str, columns):
+        super().__init__(path, columns)
+        # BOM so Excel detects UTF-8 and shows the Arabic names correctly
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+        self.file.flush()
+
+    def _write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink(RowSink):
+    """Buffers rows into row groups; the file is readable once closed."""
+
+    def __init__(self, path: str, columns, row_group_rows: int = None):
+        super().__init__(path, columns)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from e
+        self.row_group_rows = row_group_rows or int(os.getenv("PARQUET_ROW_GROUP_ROWS", PARQUET_ROW_GROUP_ROWS))
+        self.buffer = []
+        self.writer = None
+
+    def _write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self.buffer and self.writer is not None:
+            return
+        table = pa.Table.from_pandas(pd.DataFrame(self.buffer, columns=self.columns), preserve_index=False)
+        if self.writer is None:
+            # Columns that are empty in the first row group would be typed null
+            schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                                for f in table.schema])
+            self.writer = pq.ParquetWriter(self.path, schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+        self.buffer = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class XlsxSink(RowSink):
+    """
+    openpyxl write-only workbook: rows are streamed to a temporary file and
+    the workbook is assembled when closed. Continues on a new sheet past
+    Excel's row limit.
+    """
+
+    def __init__(self, path: str, columns):
+        super().__init__(path, columns)
+        from openpyxl import Workbook
+
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheet = self.workbook.create_sheet(f"Sheet{len(self.workbook.worksheets) + 1}")
+        self.sheet.append(self.columns)
+        self.sheet_rows = 1
+
+    def _write(self, rows):
+        for row in rows:
+            if self.sheet_rows == XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+SINKS = {"csv": CSVSink, "parquet": ParquetSink, "xlsx": XlsxSink}
+
+
+def open_sink(base_path: str, columns, output_format: str = None) -> RowSink:
+    """
+    Open a streaming writer for `base_path` plus the format's extension.
+
+    Args:
+        base_path: Output path without extension
+        columns: Header row
+        output_format: "xlsx", "csv" or "parquet" (default OUTPUT_FORMAT)
+    """
+    output_format = (output_format or os.getenv("OUTPUT_FORMAT", OUTPUT_FORMAT)).lower()
+    if output_format not in SINKS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(SINKS)}")
+    return SINKS[output_format](f"{base_path}.{output_format}", columns)
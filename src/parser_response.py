@@ -1,21 +1,126 @@
 import ast
+import json
+import re
 
+# Schemas of the OCR replies, for response_format={"type": "json_schema"}.
+# Strict mode needs every key to be required, so a name that is not on the
+# logo comes back as an empty string; the parser drops empty names.
+_NAMES = {"EN": {"type": "string"}, "AR": {"type": "string"}}
 
+BRAND_SCHEMA = {
+    "name": "brand",
+    "strict": True,
+    "schema": {"type": "object", "properties": _NAMES, "required": ["EN", "AR"], "additionalProperties": False},
+}
 
+BATCH_SCHEMA = {
+    "name": "brands",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {"images": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"IMAGE": {"type": "integer"}, **_NAMES},
+            "required": ["IMAGE", "EN", "AR"],
+            "additionalProperties": False,
+        }}},
+        "required": ["images"],
+        "additionalProperties": False,
+    },
+}
 
-def parser(response):
-    if not isinstance(response,str):
-        return "Not a string"
-    
+_FENCE = re.compile(r'^\s*```[a-z]*\s*|\s*```\s*$')
 
+
+class ReplyError(ValueError):
+    """An OCR reply that does not hold what the prompt asked for."""
+
+
+def load_reply(text: str, literal: bool = False):
+    """
+    Decode a reply: JSON, or with `literal` also a python literal, for the
+    plain-text prompt that asks for a python dict. A Markdown code fence
+    around it is removed.
+    """
+    if not isinstance(text, str):
+        raise ReplyError("empty reply")
+    text = _FENCE.sub('', text)
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        if not literal:
+            raise ReplyError(f"not JSON: {text[:80]!r}") from e
     try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise ReplyError(f"not JSON: {text[:80]!r}") from e
+
+
+def brand_names(answer) -> dict:
+    """The EN and AR names of one answer, empty ones left out."""
+    if not isinstance(answer, dict):
+        raise ReplyError(f"expected an object, got {type(answer).__name__}")
+    names = {}
+    for key in ('EN', 'AR'):
+        value = answer.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            raise ReplyError(f"{key} is not a string")
+        if value.strip():
+            names[key] = value.strip()
+    return names
+
+
+def parse_reply(text: str, literal: bool = False) -> dict:
+    """
+    Parse the reply to a one-image request (`literal`: see `load_reply`).
+
+    Returns:
+        {"EN": ..., "AR": ...} with the names found, {} for an unreadable brand
+    Raises:
+        ReplyError: The reply is not an object of string names
+    """
+    return brand_names(load_reply(text, literal))
+
+
+def parse_batch_reply(text: str, count: int, literal: bool = False) -> list:
+    """
+    Parse the reply to a request carrying `count` images (`literal`: see
+    `load_reply`).
+
+    Answers are matched by their IMAGE number, or by position when the reply
+    has exactly one answer per image. The list may come bare (plain-text
+    prompt) or under "images" (structured outputs).
+
+    Returns:
+        One names dict per image, None for images the reply did not cover
+        or whose answer is malformed
+    Raises:
+        ReplyError: The reply is not a list of answers
+    """
+    data = load_reply(text, literal)
+    if isinstance(data, dict):
+        data = data.get("images")
+    if not isinstance(data, list):
+        raise ReplyError("expected a list of answers")
 
-        if response.strip().startswith('{') and response.strip().endswith('}'):
-            dict_data = ast.literal_eval(response)
-            if isinstance(dict_data,dict):
-                return dict_data
-            
-        return "String but not dict"
-    except (ValueError,SyntaxError):
-        return "string but not a valied dict"
-    
+    answers = [None] * count
+    for position, item in enumerate(data):
+        if not isinstance(item, dict):
+            continue
+        if 'IMAGE' in item:
+            try:
+                index = int(item['IMAGE']) - 1
+            except (TypeError, ValueError):
+                continue
+        elif len(data) == count:
+            index = position
+        else:
+            continue
+        if 0 <= index < count:
+            try:
+                answers[index] = brand_names(item)
+            except ReplyError:
+                pass
+    return answers
@@ -57,4 +57,27 @@ pattern_req = [
     # Most flexible pattern (use cautiously)
     r'[ﻗق].*?[ﻋع].*?[ﻁط].*?[ﺭر].*?[ﻢم]\s*[: .-]\s*(\d+)',
      r'ﻗﺪﻡ ﻋﻨﻬﺎ ﻁﻠﺐ ﺭﻗﻢ :\s*(\d+)'
-]
\ No newline at end of file
+]
+
+# The same patterns for text passed through `text_fields.normalize_text`
+# (NFKC folds presentation forms such as ﻓﺌﺔ and ﻼﻣﺔ, tatweel and zero-width
+# characters are removed, Arabic-Indic digits become ASCII). Variants that only
+# differed in those respects collapse into one, and patterns that can never win
+# (every match of them implies a match of an earlier pattern) are left out.
+# Priority is the list order. Each pattern has exactly one group.
+normalized_patterns = [
+    r'المة\s*:\s*(\d+)',                    # Arabic with colon
+    r'لامة\s*:\s*(\d+)',                    # Lam-alef ligature form with colon
+    r'ة\s*الم\s*:\s*(\d+)',                 # Separated Arabic with colon
+    r'المة\s*:?\s*(\d+)',                   # Arabic with optional colon
+    r'لامة\s*:?\s*(\d+)',                   # Lam-alef ligature form with optional colon
+    r'ة\s*الم\s*:?\s*(\d+)',                # Separated Arabic with optional colon
+    r'فئة\s*(\d+)',                         # Category word (also الفئة, بالفئة)
+]
+
+normalized_pattern_req = [
+    r'قدم\s*عنه\s*اطلب\s*رقم\s*[: .-]\s*(\d+)',
+    r'ق{1,2}\s*د{1,2}\s*م{1,2}\s*ع{1,2}\s*ن{1,2}\s*ه{1,2}\s*ا{1,2}\s*ط{1,2}\s*ل{1,2}\s*ب{1,2}\s*ر{1,2}\s*ق{1,2}\s*م{1,2}\s*[: .-]\s*(\d+)',
+    r'قد\s*عن\s*ه\s*اطلب\s*رقم\s*[: .-]\s*(\d+)',
+    r'ق.*?ع.*?ط.*?ر.*?م\s*[: .-]\s*(\d+)',  # Most flexible pattern (also covers the exact phrase)
+]
@@ -0,0 +1,219 @@
+import multiprocessing
+import os
+import signal
+from concurrent.futures import FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import fitz
+
+from src.metrics import set_metrics
+from src.rate_limiter import set_limiter
+
+# Defaults for splitting the work; each one can be overridden from the .env
+# file (PAGE_CHUNK_SIZE, IMAGE_CHUNK_SIZE, SHARED_PDF_MAX_MB)
+PAGE_CHUNK_SIZE = 8  # Contiguous pages handed to a worker per task
+IMAGE_CHUNK_SIZE = 4  # Images handed to a worker per task, however they are spread over pages
+SHARED_PDF_MAX_MB = 32  # Larger files are opened from disk by every worker; /dev/shm is often small
+
+CANCEL_POLL_SECONDS = 0.2  # How often a running job checks its cancel event
+
+_worker_doc = None
+_worker_shm = None  # The shared memory block _worker_doc is read from, if any
+_worker_source = None
+_worker_memo = {}
+
+
+def page_ranges(total_pages: int, chunk_size: int = None, skip=()) -> List[Tuple[int, int]]:
+    """Split the document into contiguous (start, end) page ranges, leaving out the pages in `skip`."""
+    chunk_size = max(1, chunk_size or int(os.getenv("PAGE_CHUNK_SIZE", PAGE_CHUNK_SIZE)))
+    ranges = []
+    start = None
+    for page in range(total_pages):
+        if page in skip:
+            if start is not None:
+                ranges.append((start, page))
+                start = None
+        elif start is None:
+            start = page
+        elif page - start == chunk_size:
+            ranges.append((start, page))
+            start = page
+    if start is not None:
+        ranges.append((start, total_pages))
+    return ranges
+
+
+def largest_first(page_xrefs: List[list]) -> List[int]:
+    """Indices of the pages (given as their xref lists) by decreasing image count, ties in page order."""
+    return sorted(range(len(page_xrefs)), key=lambda i: -len(page_xrefs[i]))
+
+
+def image_chunks(page_xrefs: List[list], chunk_size: int = None, skip=()) -> Tuple[List[List[int]], int]:
+    """
+    Second level of the scheduler: split the distinct images of the
+    enumerated pages into small tasks, so a page with 60 logos is spread
+    over all the workers instead of keeping one busy. Images come in the
+    order of `page_xrefs` (see `largest_first`), and xrefs in `skip` are
+    left out.
+
+    Returns:
+        (chunks of xrefs, number of repeated occurrences left out)
+    """
+    chunk_size = max(1, chunk_size or int(os.getenv("IMAGE_CHUNK_SIZE", IMAGE_CHUNK_SIZE)))
+    seen = set()
+    ordered = []
+    repeats = 0
+    for xrefs in page_xrefs:
+        for xref in xrefs:
+            if xref in seen:
+                repeats += 1
+                continue
+            seen.add(xref)
+            if xref not in skip:
+                ordered.append(xref)
+    return [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)], repeats
+
+
+def share_pdf(pdf_path: str):
+    """
+    Load a small PDF once into shared memory so the workers open it from
+    memory instead of each reading it from (possibly network-mounted) disk.
+    The workers read the block in place (see `open_pdf`), so the file is in
+    memory once however many workers there are.
+
+    Returns:
+        (source, shm): `source` is what `init_worker` expects, `shm` is the
+        SharedMemory block to release with `release_pdf`, or None when the
+        file is too big and the workers open the path themselves.
+    """
+    size = os.path.getsize(pdf_path)
+    if size == 0 or size > float(os.getenv("SHARED_PDF_MAX_MB", SHARED_PDF_MAX_MB)) * 1024 * 1024:
+        return pdf_path, None
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    with open(pdf_path, 'rb') as f:
+        f.readinto(shm.buf)
+    return (shm.name, size), shm
+
+
+def release_pdf(shm):
+    """Free the shared memory block created by `share_pdf`."""
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+
+def open_pdf(source) -> Tuple[fitz.Document, shared_memory.SharedMemory]:
+    """
+    Open a document from a path or from a (shared memory name, size) pair.
+    A shared document is read straight from the block, without a private copy.
+
+    Returns:
+        (document, the attached SharedMemory block or None); the block must
+        stay open until the document is closed (see `close_pdf`)
+    """
+    if isinstance(source, str):
+        return fitz.open(source), None
+    name, size = source
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return fitz.open(stream=shm.buf[:size], filetype="pdf"), shm
+    except Exception:
+        shm.close()
+        raise
+
+
+def close_pdf(doc: fitz.Document, shm: shared_memory.SharedMemory = None):
+    """Close a document from `open_pdf`, then detach its shared memory block."""
+    doc.close()
+    if shm is not None:
+        try:
+            shm.close()
+        except BufferError:
+            pass  # The document still holds the view; the mapping goes with the process
+
+
+def worker_pids(max_workers: int):
+    """
+    Shared slots in which the workers of a new pool record their process
+    ids (pass it to `init_worker`), so `stop_pool` can terminate them.
+    """
+    return multiprocessing.Array('i', max_workers)
+
+
+def init_worker(source=None, limiter=None, metrics=None, pids=None):
+    """
+    Pool initializer: install the pool's shared rate limiter and metrics, and open the
+    document once for the lifetime of this worker. A pool shared by several
+    PDFs starts without a document (see `worker_document`). `pids`, from
+    `worker_pids`, gets this worker's process id.
+    """
+    if pids is not None:
+        with pids.get_lock():
+            for slot in range(len(pids)):
+                if not pids[slot]:
+                    pids[slot] = os.getpid()
+                    break
+    if limiter is not None:
+        set_limiter(limiter)
+    if metrics is not None:
+        set_metrics(metrics)
+    if source is not None:
+        worker_document(source)
+
+
+def worker_document(source=None) -> fitz.Document:
+    """
+    Return the document opened in this process. When `source` names another
+    document (a pool reused for the next PDF), that one replaces it.
+    """
+    global _worker_doc, _worker_shm, _worker_source, _worker_memo
+    if source is not None and source != _worker_source:
+        if _worker_doc is not None:
+            close_pdf(_worker_doc, _worker_shm)
+            _worker_doc = None
+        _worker_doc, _worker_shm = open_pdf(source)
+        _worker_source = source
+        _worker_memo = {}
+    if _worker_doc is None:
+        raise RuntimeError("init_worker has not opened a document in this process")
+    return _worker_doc
+
+
+def worker_memo(name: str) -> dict:
+    """
+    A dict that lives as long as this worker's current document, for
+    results keyed by xref: an image shared by many pages (header, watermark)
+    is then read once per worker instead of once per page.
+    """
+    return _worker_memo.setdefault(name, {})
+
+
+def completed(futures, cancel=None):
+    """
+    Yield futures as they finish, like `as_completed`, but stop waiting as
+    soon as the `cancel` event (a threading.Event) is set.
+    """
+    pending = set(futures)
+    while pending and not (cancel is not None and cancel.is_set()):
+        done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+        yield from done
+
+
+def stop_pool(executor, futures=(), pids=None):
+    """
+    Drop the queued tasks of a cancelled job. Given the pool's `pids` (see
+    `worker_pids`) the workers are terminated as well, so tasks already
+    running (OCR calls) stop at once instead of being waited for; only pass
+    them for a pool the job owns.
+    """
+    for future in futures:
+        future.cancel()
+    if pids is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for pid in pids[:]:
+            if pid:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass  # Already gone
@@ -0,0 +1,220 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+
+from src.metrics import get_metrics
+
+# Defaults for the API budget; each one can be overridden from the .env file
+# (REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, TOKENS_PER_REQUEST)
+REQUESTS_PER_MINUTE = 13  # Safety margin to avoid hitting the limit
+TOKENS_PER_MINUTE = 0  # 0 disables the token budget
+TOKENS_PER_REQUEST = 1000  # Estimate reserved before the API reports real usage
+
+# Retry policy for 429 responses and transient errors (see is_transient)
+MAX_RETRIES = 10
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_CAP = 60.0  # seconds
+
+# Slots in the shared state array
+_REQUESTS, _TOKENS, _LAST_REFILL = range(3)
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter shared by every worker process of a pool.
+
+    The bucket levels live in shared memory guarded by a multiprocessing lock,
+    so N workers together stay within one requests-per-minute (and optionally
+    tokens-per-minute) budget instead of each spending its own. Pass the
+    limiter to the workers through the pool initializer (see `set_limiter`).
+
+    Reservations may drive a bucket negative: the caller then waits until its
+    slot comes up, which queues the workers in order instead of letting them
+    race for the next free slot.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 tokens_per_request: int = None):
+        self.rpm = requests_per_minute or float(os.getenv("REQUESTS_PER_MINUTE", REQUESTS_PER_MINUTE))
+        if tokens_per_minute is None:
+            tokens_per_minute = float(os.getenv("TOKENS_PER_MINUTE", TOKENS_PER_MINUTE))
+        self.tpm = tokens_per_minute
+        self.tokens_per_request = tokens_per_request or int(os.getenv("TOKENS_PER_REQUEST", TOKENS_PER_REQUEST))
+        self._lock = multiprocessing.Lock()
+        # Start with one request and a full minute of tokens available
+        self._state = multiprocessing.RawArray('d', [1.0, self.tpm, time.time()])
+
+    def _refill(self, now: float):
+        state = self._state
+        elapsed = now - state[_LAST_REFILL]
+        state[_REQUESTS] = min(1.0, state[_REQUESTS] + elapsed * self.rpm / 60)
+        if self.tpm:
+            state[_TOKENS] = min(self.tpm, state[_TOKENS] + elapsed * self.tpm / 60)
+        state[_LAST_REFILL] = now
+
+    def reserve(self, tokens: int = None) -> float:
+        """
+        Reserve one request (and `tokens` tokens) from the budget.
+
+        Returns:
+            Seconds the caller must wait before sending the request
+        """
+        tokens = self.tokens_per_request if tokens is None else tokens
+        with self._lock:
+            self._refill(time.time())
+            state = self._state
+            state[_REQUESTS] -= 1
+            wait = -state[_REQUESTS] * 60 / self.rpm
+            if self.tpm:
+                state[_TOKENS] -= tokens
+                wait = max(wait, -state[_TOKENS] * 60 / self.tpm)
+        return max(0.0, wait)
+
+    def acquire(self, tokens: int = None):
+        """Block until a request fits in the budget."""
+        time.sleep(self.reserve(tokens))
+
+    def record_usage(self, reserved: int, used: int):
+        """Give back (or charge) the difference between estimated and real token usage."""
+        if not self.tpm or not used:
+            return
+        with self._lock:
+            self._state[_TOKENS] += reserved - used
+
+    def block_for(self, seconds: float):
+        """Push the next free slot of every worker at least `seconds` into the future."""
+        with self._lock:
+            self._refill(time.time())
+            self._state[_REQUESTS] = min(self._state[_REQUESTS], -seconds * self.rpm / 60)
+
+
+def retry_after(error) -> float:
+    """Return the server's Retry-After delay in seconds, or None if it sent none."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # HTTP-date form, fall back to our own backoff
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, so workers that hit a 429 together do not retry together."""
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_transient(error) -> bool:
+    """
+    Whether `error` is one the OpenAI SDK retries by default: a connection
+    error or timeout, a 408, 409 or a 5xx. The clients are built with
+    max_retries=0, so these are retried here like 429s.
+    """
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(error, openai.APIStatusError) and (status in (408, 409) or status >= 500)
+
+
+def call_with_limits(request, *args, weight: int = 1):
+    """
+    Send `request(*args)` within the shared budget, retrying rate-limit and
+    transient errors.
+
+    Args:
+        request: Function returning (result, used_tokens)
+        weight: Number of images in the request, used to reserve tokens
+    Returns:
+        The request's result
+    """
+    import openai  # Most of a second to import; processes that never send a request skip it
+
+    limiter = get_limiter()
+    metrics = get_metrics()
+    for attempt in range(MAX_RETRIES):
+        reserved = limiter.tokens_per_request * weight
+        with metrics.timer("rate_limit_wait"):
+            time.sleep(limiter.reserve(reserved))
+        metrics.count("ocr_images", weight)
+        try:
+            with metrics.timer("ocr_request"):
+                result, used_tokens = request(*args)
+            limiter.record_usage(reserved, used_tokens)
+            metrics.count("tokens", used_tokens)
+            return result
+        except openai.RateLimitError as e:
+            delay = retry_after(e) or backoff_delay(attempt)
+            print(f"Rate limit reached: {e}. Retrying after {delay:.1f} seconds...")
+            metrics.count("rate_limit_retries")
+            limiter.block_for(delay)
+        except Exception as e:
+            if is_transient(e) and attempt < MAX_RETRIES - 1:
+                # Only this caller backs off: the budget is not the problem
+                delay = backoff_delay(attempt)
+                print(f"OCR request failed: {e}. Retrying after {delay:.1f} seconds...")
+                metrics.count("transient_retries")
+                time.sleep(delay)
+                continue
+            print(f"Unexpected error during OCR: {e}")
+            metrics.count("ocr_errors")
+            raise  # Re-raise unexpected errors
+    raise RuntimeError(f"OCR still rate limited after {MAX_RETRIES} attempts")
+
+
+async def call_with_limits_async(request, *args, weight: int = 1):
+    """Coroutine version of `call_with_limits` for an async `request`."""
+    import openai
+
+    limiter = get_limiter()
+    metrics = get_metrics()
+    for attempt in range(MAX_RETRIES):
+        reserved = limiter.tokens_per_request * weight
+        with metrics.timer("rate_limit_wait"):
+            await asyncio.sleep(limiter.reserve(reserved))
+        metrics.count("ocr_images", weight)
+        try:
+            with metrics.timer("ocr_request"):
+                result, used_tokens = await request(*args)
+            limiter.record_usage(reserved, used_tokens)
+            metrics.count("tokens", used_tokens)
+            return result
+        except openai.RateLimitError as e:
+            delay = retry_after(e) or backoff_delay(attempt)
+            print(f"Rate limit reached: {e}. Retrying after {delay:.1f} seconds...")
+            metrics.count("rate_limit_retries")
+            limiter.block_for(delay)
+        except Exception as e:
+            if is_transient(e) and attempt < MAX_RETRIES - 1:
+                delay = backoff_delay(attempt)
+                print(f"OCR request failed: {e}. Retrying after {delay:.1f} seconds...")
+                metrics.count("transient_retries")
+                await asyncio.sleep(delay)
+                continue
+            metrics.count("ocr_errors")
+            raise
+    raise RuntimeError(f"OCR still rate limited after {MAX_RETRIES} attempts")
+
+
+_limiter = None
+
+
+def set_limiter(limiter: RateLimiter):
+    """Install the pool's shared limiter in this process (use as a pool initializer)."""
+    global _limiter
+    _limiter = limiter
+
+
+def get_limiter() -> RateLimiter:
+    """Return the shared limiter, or a process-local one when no pool installed it."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
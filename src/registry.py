@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src.similar_names import build_index, needs_index
+
+# Workbook columns used for matching
+REGISTRY_COLUMNS = ['name', 'grp_code', 'serial', 'file_no']
+
+# Bump when the snapshot layout changes (2: no stored index)
+SNAPSHOT_VERSION = 2
+
+_SEPARATOR = '\x00'  # Cannot occur in an Excel cell
+
+
+def file_digest(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_dir(excel_path: str) -> str:
+    """Folder holding the snapshot of a workbook, next to it."""
+    return f"{excel_path}.snapshot"
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def normalize_registry(registry: pd.DataFrame) -> pd.DataFrame:
+    """
+    Typed registry: numeric columns keep their dtype, every other column
+    holds strings (None when empty), whatever mix of types Excel produced.
+    """
+    columns = {}
+    for column in REGISTRY_COLUMNS:
+        series = registry[column]
+        if _is_numeric(series):
+            columns[column] = series.to_numpy()
+        else:
+            columns[column] = [None if pd.isna(value) else str(value) for value in series.tolist()]
+    return pd.DataFrame(columns)
+
+
+def _write_snapshot(folder: str, registry: pd.DataFrame, size: int, mtime_ns: int, digest: str):
+    tmp = f"{folder}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    kinds = {}
+    for column in REGISTRY_COLUMNS:
+        series = registry[column]
+        if _is_numeric(series):
+            np.save(os.path.join(tmp, f"{column}.npy"), series.to_numpy())
+            kinds[column] = "numeric"
+        else:
+            values = series.tolist()
+            missing = np.array([value is None or pd.isna(value) for value in values], dtype=bool)
+            with open(os.path.join(tmp, f"{column}.txt"), 'w', encoding='utf-8', newline='') as f:
+                f.write(_SEPARATOR.join('' if m else value for value, m in zip(values, missing)))
+            np.save(os.path.join(tmp, f"{column}.missing.npy"), missing)
+            kinds[column] = "text"
+    meta = {"version": SNAPSHOT_VERSION, "size": size, "mtime_ns": mtime_ns, "sha256": digest,
+            "rows": len(registry), "columns": kinds}
+    with open(os.path.join(tmp, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+
+
+def _read_meta(folder: str):
+    try:
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == SNAPSHOT_VERSION else None
+
+
+def _read_snapshot(folder: str, meta: dict) -> pd.DataFrame:
+    columns = {}
+    for column, kind in meta["columns"].items():
+        if kind == "numeric":
+            columns[column] = np.load(os.path.join(folder, f"{column}.npy"), mmap_mode='r')
+            continue
+        with open(os.path.join(folder, f"{column}.txt"), encoding='utf-8', newline='') as f:
+            values = f.read().split(_SEPARATOR) if meta["rows"] else []
+        missing = np.load(os.path.join(folder, f"{column}.missing.npy"))
+        if missing.any():
+            values = [None if m else value for value, m in zip(values, missing)]
+        columns[column] = values
+    return pd.DataFrame(columns)
+
+
+def _build_index(registry: pd.DataFrame, sim_cat: bool):
+    # Built from the snapshot rather than stored: the folder may sit on a
+    # shared drive, and unpickling a file from there would run its code
+    names = registry['name'].tolist()
+    return build_index(names, registry['grp_code'].tolist() if sim_cat else None)
+
+
+def load_registry(excel_path: str, sim_cat: bool = False, threshold=100, with_index: bool = None):
+    """
+    Load the registry columns of the trademark workbook.
+
+    The first load reads the workbook and stores a typed snapshot next to it.
+    Later loads read the snapshot as long as the workbook's size and mtime
+    are unchanged, or its content hash when they are not (a copied or
+    touched file). The snapshot holds plain arrays and text only; the matching
+    index is rebuilt from it.
+
+    Args:
+        excel_path: Path to the registry workbook
+        sim_cat: Whether the index is for category-restricted matching
+        threshold: Similarity threshold the index will be used at
+        with_index: Return a matching index, default when MATCH_ENGINE is
+            "index" and `threshold` is high enough for the index to be used
+    Returns:
+        (registry DataFrame with REGISTRY_COLUMNS, index or None)
+    """
+    if with_index is None:
+        with_index = needs_index(threshold)
+    folder = snapshot_dir(excel_path)
+    stat = os.stat(excel_path)
+    meta = _read_meta(folder)
+
+    if meta and (meta["size"], meta["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+        if meta["size"] == stat.st_size and meta["sha256"] == file_digest(excel_path):
+            meta["mtime_ns"] = stat.st_mtime_ns
+            try:
+                with open(os.path.join(folder, "meta.json"), 'w') as f:
+                    json.dump(meta, f)
+            except OSError:
+                pass
+        else:
+            meta = None
+
+    if meta is None:
+        registry = normalize_registry(pd.read_excel(excel_path, usecols=REGISTRY_COLUMNS))
+        try:
+            _write_snapshot(folder, registry, stat.st_size, stat.st_mtime_ns, file_digest(excel_path))
+        except OSError as e:
+            print(f"Could not store registry snapshot: {e}")
+    else:
+        registry = _read_snapshot(folder, meta)
+
+    return registry, _build_index(registry, sim_cat) if with_index else None
@@ -1,13 +1,157 @@
-from fuzzywuzzy import fuzz
+import os
+
+import numpy as np
+from fuzzywuzzy import fuzz, utils
 import pandas as pd
+from rapidfuzz import fuzz as rapid_fuzz, process
+
+from src.name_index import CategoryPartitions, NameIndex, normalize_category
+
+# Matching engine: "index" scores only the candidates of an n-gram index,
+# "rapidfuzz" scores all names in one vectorized cdist call, "fuzzywuzzy" is
+# the original pair-by-pair loop. Each can be overridden from the .env file
+# (MATCH_ENGINE, MATCH_CHUNK_CELLS, MATCH_INDEX_MIN_THRESHOLD,
+# MATCH_OUTPUT_CHUNK_ROWS)
+MATCH_ENGINE = "index"
+MATCH_CHUNK_CELLS = 20_000_000  # Scores computed per cdist call (4 bytes each)
+MATCH_INDEX_MIN_THRESHOLD = 85  # Below this the index prunes too little and all-pairs cdist is faster
+MATCH_OUTPUT_CHUNK_ROWS = 50000  # Output rows per DataFrame yielded by iter_similar_names
+
+# Registry columns added to every OCR row in the output
+SIMILAR_COLUMNS = ['Similar_Names', 'Similar_Cat_Id', 'Similar_Index', 'Similer_serial', 'Similar_file_no']
+
+
+def sort_tokens(name) -> str:
+    """fuzzywuzzy's token_sort preprocessing, done once per name instead of once per pair."""
+    if name is None:
+        return ""
+    return " ".join(sorted(utils.full_process(str(name), force_ascii=True).split()))
+
+
+def _match_processed(processed, choices, threshold, chunk_cells=None):
+    chunk_cells = chunk_cells or int(os.getenv("MATCH_CHUNK_CELLS", MATCH_CHUNK_CELLS))
+    empty_choices = np.array([not choice for choice in choices], dtype=bool)
+    rows = max(1, chunk_cells // max(1, len(choices)))
+    for start in range(0, len(processed), rows):
+        block = processed[start:start + rows]
+        scores = process.cdist(block, choices, scorer=rapid_fuzz.ratio, processor=None,
+                               score_cutoff=max(0, threshold - 0.5), dtype=np.float32, workers=-1)
+        scores[:, empty_choices] = 0
+        scores[[not query for query in block]] = 0
+        hits = np.rint(scores) >= threshold
+        for i, row in enumerate(hits):
+            yield start + i, np.flatnonzero(row)
+
+
+def match_names(queries, names, threshold=100, chunk_cells=None):
+    """
+    Score every query against every registry name with token_sort_ratio.
+
+    Scores are rounded to integers before the threshold is applied, like
+    fuzzywuzzy does, and a name that is empty after preprocessing scores 0.
+    The score matrix is computed a block of queries at a time on all cores.
+
+    Args:
+        queries: Names to look up
+        names: Registry names
+        threshold: Minimum score, 0-100
+    Returns:
+        Generator of (query index, sorted array of matching name indices)
+    """
+    return _match_processed([sort_tokens(query) for query in queries], [sort_tokens(name) for name in names],
+                            threshold, chunk_cells)
+
+
+def build_index(names, categories=None):
+    """
+    Build the candidate index of a registry's names, to reuse across calls.
+    Pass the registry's categories to get one index per category, as needed
+    for `sim_cat` matching.
+    """
+    choices = [sort_tokens(name) for name in names]
+    if categories is None:
+        return NameIndex(choices)
+    return CategoryPartitions(choices, categories)
+
+
+def _use_index(threshold) -> bool:
+    return threshold >= float(os.getenv("MATCH_INDEX_MIN_THRESHOLD", MATCH_INDEX_MIN_THRESHOLD))
+
+
+def needs_index(threshold, engine=None) -> bool:
+    """Whether matching at `threshold` with `engine` (default MATCH_ENGINE) would use an index."""
+    return (engine or os.getenv("MATCH_ENGINE", MATCH_ENGINE)) == "index" and _use_index(threshold)
+
+
+def match_names_indexed(queries, index: NameIndex, threshold=100):
+    """Same results as `match_names`, scoring only the index's candidates."""
+    for query_index, query in enumerate(queries):
+        yield query_index, index.match(sort_tokens(query), threshold)
+
+
+def match_names_by_category(queries, categories, partitions: CategoryPartitions, threshold=100):
+    """
+    Like `match_names`, but each query is only scored against the registry
+    names of its own category.
+
+    Args:
+        queries: Names to look up
+        categories: Category code of each query
+        partitions: The registry grouped by category
+    Returns:
+        Generator of (query index, sorted array of matching name indices)
+    """
+    groups = {}
+    for query_index, category in enumerate(categories):
+        groups.setdefault(normalize_category(category), []).append(query_index)
+
+    for code, members in groups.items():
+        rows = partitions.rows.get(code)
+        if rows is None:
+            for query_index in members:
+                yield query_index, np.empty(0, dtype=np.int64)
+            continue
+        processed = [sort_tokens(queries[query_index]) for query_index in members]
+        if partitions.indexes is not None and _use_index(threshold):
+            index = partitions.indexes[code]
+            matches = ((i, index.match(query, threshold)) for i, query in enumerate(processed))
+        else:
+            matches = _match_processed(processed, partitions.choices[code], threshold)
+        for i, local in matches:
+            yield members[i], rows[local]
+
+
+def _similar_names_rapidfuzz(names_list, cat_list, ocr_df, threshold, sim_cat, index=None):
+    # Every distinct OCR name (with its category for sim_cat)
+    queries = {}
+    for arabic_name, english_name, cat in zip(ocr_df['Magazine_Arabic_Name'], ocr_df['Magazine_English_Name'],
+                                              ocr_df['Magazine_Category_id']):
+        cat = normalize_category(cat) if sim_cat else None
+        for name in (str(arabic_name), str(english_name)):
+            queries.setdefault((name, cat) if sim_cat else name, (name, cat))
+    keys = list(queries)
+    query_names = [queries[key][0] for key in keys]
+
+    if sim_cat:
+        if index is None:
+            index = CategoryPartitions([sort_tokens(name) for name in names_list], cat_list, indexed=False)
+        matches = match_names_by_category(query_names, [queries[key][1] for key in keys], index, threshold)
+    elif index is not None and _use_index(threshold):
+        matches = match_names_indexed(query_names, index, threshold)
+    else:
+        matches = match_names(query_names, names_list, threshold)
+
+    similar_names_dict = {}
+    for query_index, indices in matches:
+        similar_names_dict[keys[query_index]] = list(dict.fromkeys(
+            names_list[i] for i in indices if names_list[i] != '.'
+        ))
+    return similar_names_dict
+
+
+def _similar_names_fuzzywuzzy(names_list, cat_list, ocr_df, threshold, sim_cat):
+    codes = [normalize_category(cat_code) for cat_code in cat_list]
 
-def find_similar_names(excel, ocr_df, threshold=100, sim_cat=False):
-    # Convert `name` column in excel to a list
-    names_list = excel['name'].tolist()
-    cat_list = excel['grp_code'].tolist()
-    serial_list = excel['serial'].tolist()
-    file = excel['file_no'].tolist()
-    
     # Initialize a dictionary to store the results
     similar_names_dict = {}
 
@@ -17,68 +161,118 @@ def find_similar_names(excel, ocr_df, threshold=100, sim_cat=False):
         english_name = str(row['Magazine_English_Name'])
         if arabic_name and english_name is None:
             print(arabic_name,english_name)
-        cat = row['Magazine_Category_id']
-        
-        # Find similar names for Arabic and English names
-        similar_arabic = [
-            name for name, cat_code in zip(names_list, cat_list) 
-            if fuzz.token_sort_ratio(name, arabic_name) >= threshold and 
-            (not sim_cat or cat_code == cat) and name != '.'
-        ]
-        
-        similar_english = [
-            name for name, cat_code in zip(names_list, cat_list) 
-            if fuzz.token_sort_ratio(name, english_name) >= threshold and 
-            (not sim_cat or cat_code == cat) and name != '.'
-        ]
-
-        
+        cat = normalize_category(row['Magazine_Category_id'])
+        if sim_cat:
+            arabic_key, english_key = (arabic_name, cat), (english_name, cat)
+        else:
+            arabic_key, english_key = arabic_name, english_name
+
+        # Find similar names for Arabic and English names, each name once:
+        # the expansion adds every registry row that carries it
+        similar_arabic = list(dict.fromkeys(
+            name for name, cat_code in zip(names_list, codes)
+            if fuzz.token_sort_ratio(name, arabic_name) >= threshold and
+            (not sim_cat or cat is not None and cat_code == cat) and name != '.'
+        ))
+
+        similar_english = list(dict.fromkeys(
+            name for name, cat_code in zip(names_list, codes)
+            if fuzz.token_sort_ratio(name, english_name) >= threshold and
+            (not sim_cat or cat is not None and cat_code == cat) and name != '.'
+        ))
+
+
         # Add to dictionary
-        if arabic_name not in similar_names_dict:
-            similar_names_dict[arabic_name] = similar_arabic
-        if english_name not in similar_names_dict:
-            similar_names_dict[english_name] = similar_english
-    
-    # Create a list to store expanded rows
-    expanded_rows = []
-    
-    # Iterate through original DataFrame to expand rows
-    for _, row in ocr_df.iterrows():
-        arabic_name = row['Magazine_Arabic_Name']
-        english_name = row['Magazine_English_Name']
-        cat_id = row['Magazine_Category_id']
-        
+        if arabic_key not in similar_names_dict:
+            similar_names_dict[arabic_key] = similar_arabic
+        if english_key not in similar_names_dict:
+            similar_names_dict[english_key] = similar_english
+    return similar_names_dict
+
+
+def iter_similar_names(excel, ocr_df, threshold=100, sim_cat=False, engine=None, index=None, chunk_rows=None):
+    """
+    Generator version of `find_similar_names`: yields the output in
+    DataFrames of about `chunk_rows` rows (default MATCH_OUTPUT_CHUNK_ROWS),
+    so large match sets can be written out without holding them in memory.
+    """
+    chunk_rows = chunk_rows or int(os.getenv("MATCH_OUTPUT_CHUNK_ROWS", MATCH_OUTPUT_CHUNK_ROWS))
+    # Convert `name` column in excel to a list
+    names_list = excel['name'].tolist()
+    cat_list = excel['grp_code'].tolist()
+    codes = [normalize_category(cat_code) for cat_code in cat_list]
+
+    engine = engine or os.getenv("MATCH_ENGINE", MATCH_ENGINE)
+    if engine == "fuzzywuzzy":
+        similar_names_dict = _similar_names_fuzzywuzzy(names_list, cat_list, ocr_df, threshold, sim_cat)
+    elif engine == "rapidfuzz":
+        similar_names_dict = _similar_names_rapidfuzz(names_list, cat_list, ocr_df, threshold, sim_cat)
+    else:
+        if index is None:
+            # Below MATCH_INDEX_MIN_THRESHOLD the index would go unused
+            if _use_index(threshold):
+                index = build_index(names_list, cat_list if sim_cat else None)
+        elif len(index) != len(names_list):
+            raise ValueError(f"Index built for {len(index)} names, registry has {len(names_list)}")
+        elif sim_cat != isinstance(index, CategoryPartitions):
+            raise ValueError("sim_cat matching needs an index built with the registry's categories")
+        similar_names_dict = _similar_names_rapidfuzz(names_list, cat_list, ocr_df, threshold, sim_cat, index)
+
+    # Registry rows of every name, built once
+    rows_of_name = {}
+    for i, name in enumerate(names_list):
+        rows_of_name.setdefault(name, []).append(i)
+
+    # Identical OCR rows would only produce identical output rows
+    ocr_df = ocr_df[~ocr_df.duplicated()]
+
+    registry_columns = [excel[column].to_numpy() for column in ('name', 'grp_code', 'serial', 'file_no')]
+
+    def take(ocr_rows, registry_rows):
+        # Build the output columns in one take from each side
+        registry_rows = np.array(registry_rows)
+        names, cats, serials, files = (column[registry_rows] for column in registry_columns)
+        expanded_df = ocr_df.iloc[ocr_rows].copy()
+        for column, values in zip(SIMILAR_COLUMNS, (names, cats, registry_rows + 2, serials, files)):
+            expanded_df[column] = values
+        return expanded_df
+
+    # (OCR row, registry row) pairs, in output order
+    ocr_rows = []
+    registry_rows = []
+    for position, (arabic_name, english_name, cat_id) in enumerate(zip(
+            ocr_df['Magazine_Arabic_Name'], ocr_df['Magazine_English_Name'], ocr_df['Magazine_Category_id'])):
+        cat_code = normalize_category(cat_id)
+
         # Get similar names for the row
-        similar_names = (
-            similar_names_dict.get(arabic_name, []) or 
-            similar_names_dict.get(english_name, [])
-        )
-        
-        # If no similar names, add the original row
-        if not similar_names:
-            pass
+        if sim_cat:
+            similar_names = (
+                similar_names_dict.get((arabic_name, cat_code), []) or
+                similar_names_dict.get((english_name, cat_code), [])
+            )
         else:
-            # Find corresponding category codes and indices for similar names
-           for similar_name in similar_names:
-            # Find all indices for this similar name
-            similar_name_indices = [i for i, name in enumerate(names_list) if name == similar_name]
-            
-            # Create a row for each index
-            for similar_name_index in similar_name_indices:
-                similar_cat_id = cat_list[similar_name_index]
-                serial = serial_list[similar_name_index]
-                
-                # Create a new row with the similar name
-                new_row = row.copy()
-                new_row['Similar_Names'] = similar_name
-                new_row['Similar_Cat_Id'] = similar_cat_id
-                new_row['Similar_Index'] = similar_name_index +2
-                new_row['Similer_serial'] = serial
-                new_row['Similar_file_no'] = file[similar_name_index]
-                expanded_rows.append(new_row)
-            
-    # Create a new DataFrame from the expanded rows
-    expanded_df = pd.DataFrame(expanded_rows).drop_duplicates()
-    
-    
-    return expanded_df
\ No newline at end of file
+            similar_names = (
+                similar_names_dict.get(arabic_name, []) or
+                similar_names_dict.get(english_name, [])
+            )
+
+        for similar_name in similar_names:
+            for similar_name_index in rows_of_name.get(similar_name, ()):
+                if not sim_cat or codes[similar_name_index] == cat_code:
+                    ocr_rows.append(position)
+                    registry_rows.append(similar_name_index)
+
+        if len(ocr_rows) >= chunk_rows:
+            yield take(ocr_rows, registry_rows)
+            ocr_rows = []
+            registry_rows = []
+
+    if ocr_rows:
+        yield take(ocr_rows, registry_rows)
+
+
+def find_similar_names(excel, ocr_df, threshold=100, sim_cat=False, engine=None, index=None):
+    chunks = list(iter_similar_names(excel, ocr_df, threshold, sim_cat, engine, index))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
@@ -0,0 +1,49 @@
+import re
+import unicodedata
+from typing import Tuple
+
+from src.pattern import normalized_patterns, normalized_pattern_req
+
+# Arabic-Indic and Extended Arabic-Indic digits become ASCII; tatweel,
+# zero-width and direction marks are removed
+_FOLD = str.maketrans(
+    '٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹',
+    '01234567890123456789',
+    '\u0640\u200b\u200c\u200d\u200e\u200f',
+)
+
+_PATTERNS = normalized_patterns + normalized_pattern_req
+_FIELD = [0] * len(normalized_patterns) + [1] * len(normalized_pattern_req)
+assert all(re.compile(p).groups == 1 for p in _PATTERNS), "each pattern needs exactly one group"
+
+# All patterns in one lookahead: it consumes nothing, so every position where
+# some pattern matches is reported and matches cannot hide each other, each
+# time with the group of the highest-priority pattern matching there. The
+# category patterns and the request-number patterns start with different
+# letters, so one field never hides the other at a position.
+_SCANNER = re.compile('(?=' + '|'.join(f'(?:{p})' for p in _PATTERNS) + ')')
+
+
+def normalize_text(text: str) -> str:
+    """Fold presentation forms, tatweel, invisible marks and Arabic digits."""
+    return unicodedata.normalize('NFKC', text).translate(_FOLD)
+
+
+def extract_fields(text: str) -> Tuple[str, str]:
+    """
+    Category id and request number of a page, in one scan of its text.
+
+    Same priority rules as `extract_cat` / `extract_request_number`: for each
+    field, the first match of the highest-priority pattern that matches
+    anywhere. Digits are returned as ASCII.
+
+    Returns:
+        (category, request_number), None for a field that was not found
+    """
+    best = [None, None]  # (priority, value) per field
+    for match in _SCANNER.finditer(normalize_text(text)):
+        priority = match.lastindex - 1
+        field = _FIELD[priority]
+        if best[field] is None or priority < best[field][0]:
+            best[field] = (priority, match.group(match.lastindex))
+    return tuple(found[1] if found else None for found in best)
@@ -0,0 +1,150 @@
+import os
+import re
+
+import fitz
+
+from src.text_fields import extract_fields, normalize_text
+
+# Where a brand name printed next to its logo is looked for; each one can be
+# overridden from the .env file (TEXT_LAYER_MAX_GAP, TEXT_LAYER_MIN_LETTERS,
+# TEXT_LAYER_MIN_NAMES). Off by default: a gap of 0 disables the text layer,
+# and about 6 points suits issues that print the names under their logos
+TEXT_LAYER_MAX_GAP = 0.0  # Points between the image and a line above or below it
+TEXT_LAYER_MIN_LETTERS = 2  # Shorter lines are labels, bullets or page numbers
+TEXT_LAYER_MIN_NAMES = 2  # Scripts that must be found to skip OCR: 2 needs both the Arabic and the English name
+SCRIPT_SHARE = 0.8  # Share of a line's letters in one script to call it Arabic or English
+
+_ARABIC = re.compile(r'[ء-يٱ-ۓۺ-ۿ]')
+_LATIN = re.compile(r'[A-Za-zÀ-ɏ]')
+
+
+def script_of(text: str) -> str:
+    """'AR' or 'EN' for a line written (almost) only in that script, else None."""
+    arabic = len(_ARABIC.findall(text))
+    latin = len(_LATIN.findall(text))
+    letters = arabic + latin
+    if not letters:
+        return None
+    if arabic >= SCRIPT_SHARE * letters:
+        return 'AR'
+    if latin >= SCRIPT_SHARE * letters:
+        return 'EN'
+    return None
+
+
+class TextLayer:
+    """
+    Names images from the page's own text: in born-digital PDFs the brand
+    name is often printed on or right next to its logo, so it can be read
+    from the text layer instead of sending the image to the vision API.
+
+    A line counts for an image when it overlaps the image horizontally and
+    sits inside it or within `max_gap` points above or below. For each script
+    the nearest such line wins, unless a different line of that script is
+    about as near. OCR is only skipped when `min_names` scripts have a clear
+    winner: by default both, since a lone nearby line may as well be an
+    applicant or an address, and OCR would also read the other name. Lines
+    holding the category or request number are never names.
+
+    Resolved images are counted in the run metrics (see `print_text_layer_summary`).
+    """
+
+    def __init__(self, max_gap: float = None, min_letters: int = None, min_names: int = None):
+        self.max_gap = float(os.getenv("TEXT_LAYER_MAX_GAP", TEXT_LAYER_MAX_GAP)) if max_gap is None else max_gap
+        self.min_letters = (int(os.getenv("TEXT_LAYER_MIN_LETTERS", TEXT_LAYER_MIN_LETTERS))
+                            if min_letters is None else min_letters)
+        self.min_names = (int(os.getenv("TEXT_LAYER_MIN_NAMES", TEXT_LAYER_MIN_NAMES))
+                          if min_names is None else min_names)
+
+    def names(self, page: fitz.Page, xrefs, metrics) -> dict:
+        """
+        Look up the given images of `page` in its text.
+
+        Returns:
+            xref -> OCR-style dict ({"AR": ..., "EN": ...}) for the images
+            whose name was found; the others are left out
+        """
+        if not self.max_gap or not xrefs:
+            return {}
+        lines = self.lines(page)
+        if not lines:
+            return {}
+        # One pass over the page for every placement, instead of page.get_image_rects per xref
+        rects = {}
+        for info in page.get_image_info(xrefs=True):
+            rects.setdefault(info["xref"], []).append(fitz.Rect(info["bbox"]))
+        found = {}
+        for xref in xrefs:
+            placements = rects.get(xref, ())
+            # An image placed several times on the page may carry several names
+            answer = self.name_near(placements[0], lines) if len(placements) == 1 else {}
+            if answer and len(answer) >= self.min_names:
+                found[xref] = answer
+                metrics.count("images_text_resolved")
+        return found
+
+    def lines(self, page: fitz.Page) -> list:
+        """
+        (bbox, script, text) of the page's text lines that could be a brand
+        name. A line is cut where its spans are further apart than their
+        font size, so captions of neighbouring columns on one baseline stay apart.
+        """
+        lines = []
+        for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+            for line in block.get("lines", ()):
+                runs = []
+                # Spans come in reading order, which runs leftwards in Arabic
+                for span in line["spans"]:
+                    box = fitz.Rect(span["bbox"])
+                    if runs and max(box.x0 - runs[-1][0].x1, runs[-1][0].x0 - box.x1) <= span["size"]:
+                        runs[-1][0] |= box
+                        runs[-1][1].append(span["text"])
+                    else:
+                        runs.append([box, [span["text"]]])
+                for box, texts in runs:
+                    text = " ".join(normalize_text("".join(texts)).split())
+                    script = script_of(text)
+                    if (script and len(_ARABIC.findall(text)) + len(_LATIN.findall(text)) >= self.min_letters
+                            and extract_fields(text) == (None, None)):
+                        lines.append((box, script, text))
+        return lines
+
+    def name_near(self, rect: fitz.Rect, lines: list) -> dict:
+        """The unambiguous nearest line of each script around `rect`, as an OCR-style dict."""
+        candidates = {}
+        for box, script, text in lines:
+            overlap = min(box.x1, rect.x1) - max(box.x0, rect.x0)
+            if overlap < 0.5 * box.width:
+                continue
+            gap = max(box.y0 - rect.y1, rect.y0 - box.y1, 0)
+            if gap <= self.max_gap:
+                candidates.setdefault(script, []).append((gap, text))
+        answer = {}
+        for script, found in candidates.items():
+            found.sort()
+            nearest = found[0][0]
+            if len({text for gap, text in found if gap <= 2 * nearest + 1}) == 1:
+                answer[script] = found[0][1]
+        return answer
+
+
+_text_layer = None
+
+
+def get_text_layer() -> TextLayer:
+    global _text_layer
+    if _text_layer is None:
+        _text_layer = TextLayer()
+    return _text_layer
+
+
+def print_text_layer_summary(before: dict, after: dict):
+    """Print how many images one run named from the page text, from two metrics counter snapshots."""
+    delta = {name: after[name] - before[name] for name in after}
+    resolved = delta['images_text_resolved']
+    # Distinct images read: kept by the size and shape checks, minus repeated xrefs
+    read = (delta['images_seen'] - delta['images_skipped_small'] - delta['images_skipped_aspect']
+            - delta['xref_repeats'])
+    if not read or not get_text_layer().max_gap:
+        return
+    print(f"Text layer: {resolved} of {read} images named from the page text, OCR skipped")
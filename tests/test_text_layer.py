@@ -0,0 +1,67 @@
+"""
+Tests for src.text_layer: when a name printed next to a logo may replace OCR.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import cv2
+import fitz
+import numpy as np
+import pytest
+
+from src.metrics import Metrics
+from src.text_layer import TextLayer
+
+LOGO = fitz.Rect(100, 100, 340, 180)
+
+
+def make_page(*lines):
+    """A page with one logo at LOGO and the given (html, rect) text boxes; returns (doc, logo xref)."""
+    doc = fitz.open()
+    page = doc.new_page()
+    logo = np.full((80, 240), 255, np.uint8)
+    cv2.rectangle(logo, (4, 4), (235, 75), 0, 3)
+    xref = page.insert_image(LOGO, stream=cv2.imencode('.png', logo)[1].tobytes())
+    for html, rect in lines:
+        page.insert_htmlbox(rect, html, css="* {font-size: 8pt; text-align: center}")
+    return doc, xref
+
+
+def under_logo(offset=1):
+    return fitz.Rect(LOGO.x0, LOGO.y1 + offset, LOGO.x1, LOGO.y1 + offset + 12)
+
+
+def over_logo(offset=1):
+    return fitz.Rect(LOGO.x0, LOGO.y0 - offset - 12, LOGO.x1, LOGO.y0 - offset)
+
+
+def names(doc, xref, **options):
+    return TextLayer(**options).names(doc[0], [xref], Metrics())
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("TEXT_LAYER_MAX_GAP", raising=False)
+    doc, xref = make_page(("<p>Nour</p>", over_logo()), ("<p>نور</p>", under_logo()))
+    assert names(doc, xref) == {}
+
+
+def test_unrelated_line_next_to_logo_is_left_to_ocr():
+    doc, xref = make_page(("<p>Applicant: Sameh Trading Co</p>", under_logo()))
+    assert names(doc, xref, max_gap=6) == {}
+
+
+def test_both_names_skip_ocr():
+    doc, xref = make_page(("<p>Nour</p>", over_logo()), ("<p>نور</p>", under_logo()))
+    assert names(doc, xref, max_gap=6) == {xref: {"EN": "Nour", "AR": "نور"}}
+
+
+@pytest.mark.parametrize("min_names, expected", [(2, False), (1, True)])
+def test_single_name_needs_min_names_1(min_names, expected):
+    doc, xref = make_page(("<p>Nour</p>", under_logo()))
+    found = names(doc, xref, max_gap=6, min_names=min_names)
+    assert (found == {xref: {"EN": "Nour"}}) is expected
+
+
+def test_line_beyond_the_gap_is_ignored():
+    doc, xref = make_page(("<p>Nour</p>", over_logo(20)), ("<p>نور</p>", under_logo(20)))
+    assert names(doc, xref, max_gap=6) == {}